@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.settings import settings
+
+
+class LLMCache:
+    """Two-tier cache of model responses keyed by (model, prompt).
+
+    Lookups hit an in-memory LRU first, then an on-disk SQLite table so
+    responses survive restarts and repeated demo runs. Entries older than
+    `ttl_seconds` are treated as misses and dropped.
+
+    Off unless `settings.LLM_CACHE_ENABLED`: the API should hand out a fresh
+    week each time, so it is meant for the demo and tests. Callers store
+    only answers that parsed.
+    """
+
+    def __init__(self, path: str, ttl_seconds: int, max_entries: int, max_disk_entries: int):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model}\0{prompt}".encode()).hexdigest()
+
+    def _conn(self) -> Optional[sqlite3.Connection]:
+        if not self.path:
+            return None
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY,"
+                " model TEXT NOT NULL,"
+                " response TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed_at)"
+            )
+            self._db.commit()
+        return self._db
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl_seconds > 0 and now - created_at > self.ttl_seconds
+
+    def _remember(self, key: str, created_at: float, response: str):
+        self._memory[key] = (created_at, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, model: str, prompt: str) -> Optional[str]:
+        key = self.key(model, prompt)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[0], now):
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[1]
+                del self._memory[key]
+
+            db = self._conn()
+            if db is not None:
+                row = db.execute(
+                    "SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    response, created_at = row
+                    if not self._expired(created_at, now):
+                        db.execute(
+                            "UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key)
+                        )
+                        db.commit()
+                        self._remember(key, created_at, response)
+                        self.disk_hits += 1
+                        return response
+                    db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    db.commit()
+
+            self.misses += 1
+            return None
+
+    def put(self, model: str, prompt: str, response: Optional[str]):
+        if not response:
+            return
+        key = self.key(model, prompt)
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, response)
+            db = self._conn()
+            if db is None:
+                return
+            db.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now),
+            )
+            if self.ttl_seconds > 0:
+                db.execute(
+                    "DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+                )
+            # Evict least recently used rows past the size cap
+            db.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                " SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,),
+            )
+            db.commit()
+
+    async def get_async(self, model: str, prompt: str) -> Optional[str]:
+        """`get`, with the SQLite lookup run off the event loop."""
+        if not self.path:
+            return self.get(model, prompt)
+        return await asyncio.to_thread(self.get, model, prompt)
+
+    async def put_async(self, model: str, prompt: str, response: Optional[str]):
+        """`put`, with the SQLite write run off the event loop."""
+        if not self.path:
+            return self.put(model, prompt, response)
+        await asyncio.to_thread(self.put, model, prompt, response)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            db = self._conn()
+            if db is not None:
+                db.execute("DELETE FROM llm_cache")
+                db.commit()
+
+    def stats(self) -> dict:
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+        }
+
+
+llm_cache = LLMCache(
+    path=settings.LLM_CACHE_PATH,
+    ttl_seconds=settings.LLM_CACHE_TTL_SECONDS,
+    max_entries=settings.LLM_CACHE_MAX_ENTRIES,
+    max_disk_entries=settings.LLM_CACHE_MAX_DISK_ENTRIES,
+)
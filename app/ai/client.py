@@ -0,0 +1,147 @@
+import asyncio
+import threading
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Optional
+
+from app.settings import settings
+from app.ai.cache import llm_cache
+from app.ai.models import MODEL
+from app.metrics import LLMCall
+
+if TYPE_CHECKING:
+    from google import genai
+    from google.genai import types
+
+# One long-lived client per process. Reusing it keeps the underlying httpx
+# connection pools (and their keep-alive connections) warm between calls.
+# google-genai takes ~0.5 s to import, so it is only imported when the
+# client is first created.
+_client: Optional["genai.Client"] = None
+_client_lock = threading.Lock()
+
+
+def _http_options() -> "types.HttpOptions":
+    import httpx
+    from google.genai import types
+
+    limits = httpx.Limits(
+        max_connections=settings.GENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.GENAI_MAX_CONNECTIONS,
+        keepalive_expiry=settings.GENAI_KEEPALIVE_SECONDS,
+    )
+    return types.HttpOptions(
+        timeout=settings.GENAI_TIMEOUT_SECONDS * 1000,  # milliseconds
+        client_args={"limits": limits},
+        async_client_args={"limits": limits},
+    )
+
+
+def init_client() -> "genai.Client":
+    """Create the shared Gemini client if it doesn't exist yet.
+
+    Called off the event loop from the app lifespan so the import cost is
+    paid in the background rather than before the first request.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            from google import genai
+
+            _client = genai.Client(
+                api_key=settings.GEMINI_API_KEY, http_options=_http_options()
+            )
+        return _client
+
+
+def get_client() -> "genai.Client":
+    """Return the shared Gemini client, creating it on first use.
+
+    Blocks while the client is being created; on the event loop use
+    `get_client_async`.
+    """
+    if _client is None:
+        return init_client()
+    return _client
+
+
+async def get_client_async() -> "genai.Client":
+    """`get_client` for the event loop. Until the client exists, creating it
+    or waiting for the lifespan's `init_client` happens in a worker thread."""
+    if _client is None:
+        return await asyncio.to_thread(init_client)
+    return _client
+
+
+def close_client() -> None:
+    """Drop the shared client so its connection pools can be released."""
+    global _client
+    with _client_lock:
+        _client = None
+
+
+# With use_cache, a cached answer is returned when there is one, and a fresh
+# answer is stored only if `cacheable(answer)` holds, so an answer that
+# doesn't parse is never replayed. Without `cacheable` nothing is stored.
+Cacheable = Optional[Callable[[str], bool]]
+
+
+def generate_text(prompt: str, model: str = MODEL, use_cache: bool = True, cacheable: Cacheable = None) -> str:
+    """Run a prompt through the shared client, consulting the response cache."""
+    use_cache = use_cache and settings.LLM_CACHE_ENABLED
+    if use_cache:
+        cached = llm_cache.get(model, prompt)
+        if cached is not None:
+            return cached
+
+    with LLMCall(model) as call:
+        response = get_client().models.generate_content(model=model, contents=prompt)
+        call.record_usage(response.usage_metadata)
+    if use_cache and cacheable is not None and cacheable(response.text):
+        llm_cache.put(model, prompt, response.text)
+    return response.text
+
+
+async def generate_text_async(
+    prompt: str, model: str = MODEL, use_cache: bool = True, cacheable: Cacheable = None
+) -> str:
+    """Non-blocking variant of `generate_text`."""
+    use_cache = use_cache and settings.LLM_CACHE_ENABLED
+    if use_cache:
+        cached = await llm_cache.get_async(model, prompt)
+        if cached is not None:
+            return cached
+
+    client = await get_client_async()
+    with LLMCall(model) as call:
+        response = await client.aio.models.generate_content(model=model, contents=prompt)
+        call.record_usage(response.usage_metadata)
+    if use_cache and cacheable is not None and cacheable(response.text):
+        await llm_cache.put_async(model, prompt, response.text)
+    return response.text
+
+
+async def generate_text_stream(
+    prompt: str, model: str = MODEL, use_cache: bool = True, cacheable: Cacheable = None
+) -> AsyncIterator[str]:
+    """Yield response text as it is generated. A cached response is yielded whole."""
+    use_cache = use_cache and settings.LLM_CACHE_ENABLED
+    if use_cache:
+        cached = await llm_cache.get_async(model, prompt)
+        if cached is not None:
+            yield cached
+            return
+
+    parts = []
+    client = await get_client_async()
+    with LLMCall(model) as call:
+        stream = await client.aio.models.generate_content_stream(model=model, contents=prompt)
+        usage = None
+        async for chunk in stream:
+            # The last chunk with usage has the totals
+            usage = chunk.usage_metadata or usage
+            if chunk.text:
+                parts.append(chunk.text)
+                yield chunk.text
+        call.record_usage(usage)
+    text = "".join(parts)
+    if use_cache and cacheable is not None and cacheable(text):
+        await llm_cache.put_async(model, prompt, text)
@@ -1,37 +1,50 @@
-from google import genai
 import dotenv
-from app.workout import WorkoutDay, WorkDone
-from app.user import UserInfo, test_users, interests_prompt
+from app.workout import WorkoutDay
+from app.user import UserInfo, test_users
 from app.test import USER
-from app.ai.tools import parse_workouts
-from typing import List
-from app.ai.models import FLASH, PRO, MODEL
+from app.ai.tools import has_workouts, parse_workouts, require_workouts
+from app.ai.client import generate_text, generate_text_async, generate_text_stream
+from app.ai.prompts import ProfileKey, week_prompt
+from typing import AsyncIterator, List, Optional, Tuple
+from app.ai.routing import generate_routed, route_model
 
 
 dotenv.load_dotenv()
 
-# The client gets the API key from the environment variable `GEMINI_API_KEY`.
+# The shared client gets the API key from `settings.GEMINI_API_KEY`.
+# With settings.LLM_CACHE_ENABLED, identical prompts are answered from
+# `app.ai.cache` unless use_cache=False.
+# `profile` (user id, profile version) lets `app.ai.prompts` reuse the
+# user's rendered sections.
+# The model comes from `app.ai.routing` ("first_week") unless given.
 
-def generate_raw_week(user: UserInfo):
-    client = genai.Client()
+def generate_raw_week(user: UserInfo, use_cache: bool = True, profile: Optional[ProfileKey] = None):
+    prompt = week_prompt(user, profile)
+    return generate_text(prompt, model=route_model("first_week", prompt), use_cache=use_cache, cacheable=has_workouts)
 
-    response = client.models.generate_content(
-        model=MODEL, contents=f"""
-Response should be comma seperated values
-Response should contain just workouts as CSV. No explanations or dialogues.
-You are the {interests_prompt(user.interests)} trainer for the following user:
-{user.semantic()}
-Create a week's (total {user.desired_workouts_per_week.start} to {user.desired_workouts_per_week.end}) worth of workouts in the following format:
-{WorkoutDay.example()}
 
-# Make sure to follow the <Week Day>: <Workout as CSV> format, do not include column names
-# Make sure to balance exercises across days
-# Make sure to include exercises and activities that satisfy all of the user's interests
-# Try to put your self into the shoes of the user, workouts should have a logical rythym and flow
+async def generate_raw_week_async(user: UserInfo, use_cache: bool = True, profile: Optional[ProfileKey] = None):
+    """Non-blocking variant of `generate_raw_week` for use inside the API."""
+    prompt = week_prompt(user, profile)
+    return await generate_text_async(prompt, model=route_model("first_week", prompt), use_cache=use_cache, cacheable=has_workouts)
 
-"""
-    )
-    return response.text
+
+async def generate_week_async(
+    user: UserInfo, use_cache: bool = True, profile: Optional[ProfileKey] = None
+) -> Tuple[List[WorkoutDay], str]:
+    """Generate and parse a week, falling back to the other model on timeout
+    or an unparseable answer. Returns the days and the model that served them."""
+    return await generate_routed("first_week", week_prompt(user, profile), require_workouts, use_cache=use_cache)
+
+
+async def generate_raw_week_stream(
+    user: UserInfo, use_cache: bool = True, profile: Optional[ProfileKey] = None, model: Optional[str] = None
+) -> AsyncIterator[str]:
+    """Yield the raw week text from the model as it is generated."""
+    prompt = week_prompt(user, profile)
+    model = model or route_model("first_week", prompt)
+    async for text in generate_text_stream(prompt, model=model, use_cache=use_cache, cacheable=has_workouts):
+        yield text
 
 
 # Example usage:
@@ -1,116 +1,129 @@
 import app.db
+import asyncio
 import json
 from app.test import USER
-from app.user import UserInfo, test_users, interests_prompt, UserFeedback
+from app.user import UserInfo, test_users, UserFeedback
 from app.workout import WorkoutDay, WorkoutWeek
-from app.ai.tools import parse_workouts
-from google import genai
+from app.ai.tools import has_workouts, parse_workouts, require_workouts
+from app.ai.client import generate_text, generate_text_async
+from app.ai.prompts import ProfileKey, progress_day_prompt, progress_week_prompt
 import dotenv
-from typing import List, Literal
-from app.ai.models import FLASH, PRO, MODEL
+from typing import Dict, List, Literal, Optional, Tuple
+from app.ai.routing import generate_routed, route_model
+from app.settings import settings
+from app.progression import ProgressType, progress_week_rules
 
 
 dotenv.load_dotenv()
 
-ProgressType = Literal["Deload", "Increase", "Decrease","Overload"]
-
-def progress_day(user: UserInfo, workout: WorkoutDay, week_goal: ProgressType):
-
-    client = genai.Client()
-
-    difficulty_semantic = ""
-    
-    match week_goal:
-        case "Deload":
-            # handle deload logic
-            difficulty_semantic = "drastically decrease intensity/volume."
-        case "Increase":
-            # handle increase logic
-            difficulty_semantic = "slightly add intensity/volume."
-        case "Decrease":
-            # handle decrease logic
-            difficulty_semantic = "slightly lower intensity/volume."
-        case "Overload":
-            # handle overload logic
-            difficulty_semantic = "raise intensity/volume to the maximum safe amount."
-        case _:
-            raise ValueError(f"Unknown ProgressType: {week_goal}")
-
-    prompt=f"""
-Response should be comma seperated values
-Response should contain just workouts as CSV. No explanations or dialogues.
-You are the {interests_prompt(user.interests)} trainer for the following user:
-{user.semantic()}
-
-Adjust the following workout to {difficulty_semantic}
-{workout.day}:
-{workout.workout_df()}
-
-# Make sure to follow the <Week Day>: <Workout as CSV> format, do not include column names
-# Always favor decreasing/increasing intensity or amount rather than adding or removing sets, this is less disruptive to the trainee
-"""
+ProgressEngine = Literal["llm", "rules"]
+
+def progress_day(user: UserInfo, workout: WorkoutDay, week_goal: ProgressType, use_cache: bool = True, profile: Optional[ProfileKey] = None):
+    prompt = progress_day_prompt(user, workout, week_goal, profile)
     print(prompt)
-    
-    response = client.models.generate_content(
-        model=MODEL, contents=prompt
-    )
-    return response.text
-
-def progress_week(user: UserInfo, week: WorkoutWeek, feedback: UserFeedback, week_goal: ProgressType):
-    client = genai.Client()
-
-    difficulty_semantic = ""
-    
-    match week_goal:
-        case "Deload":
-            # handle deload logic
-            difficulty_semantic = "drastically decrease intensity/volume."
-        case "Increase":
-            # handle increase logic
-            difficulty_semantic = "slightly add intensity/volume."
-        case "Decrease":
-            # handle decrease logic
-            difficulty_semantic = "slightly lower intensity/volume."
-        case "Overload":
-            # handle overload logic
-            difficulty_semantic = "raise intensity/volume to the maximum safe amount."
-        case _:
-            raise ValueError(f"Unknown ProgressType: {week_goal}")
-
-    prompt=f"""
-Response should be comma seperated values
-Response should contain just workouts as CSV. No explanations or dialogues.
-You are the {interests_prompt(user.interests)} trainer for the following user:
-{user.semantic()}
-
-
-
-Workouts are in the following format:
-{WorkoutDay.example()}
-
-Overall, adjust the user's previous week to {difficulty_semantic}
-
-# Make sure to follow the <Week Day>: <Workout as CSV> format, do not include column names
-# Make sure to use the same week days from the previosue week
-# Remove/add exercises as needed to accomodate the user's feedback
-# Pay special attention to the user opinion on their interests and feedback on muscle groups
-# When adding or removing things, try to keep the same number of sets and reps as the previous week
-# Feel free to add new exercises, but make sure they are relevant to the user, 
-
-The user has the following feedback for the week:
-{feedback.semantic()}
-
-User's Previous week:
-{week.semantic()}
-"""
+
+    return generate_text(prompt, model=route_model("progress_day", prompt), use_cache=use_cache, cacheable=has_workouts)
+
+
+async def progress_day_async(user: UserInfo, workout: WorkoutDay, week_goal: ProgressType, use_cache: bool = True, profile: Optional[ProfileKey] = None):
+    """Non-blocking variant of `progress_day` for use inside the API."""
+    prompt = progress_day_prompt(user, workout, week_goal, profile)
     print(prompt)
-    
-    response = client.models.generate_content(
-        model=MODEL, contents=prompt
-    )
-    return response.text
 
+    return await generate_text_async(prompt, model=route_model("progress_day", prompt), use_cache=use_cache, cacheable=has_workouts)
+
+
+def progress_week(user: UserInfo, week: WorkoutWeek, feedback: UserFeedback, week_goal: ProgressType, use_cache: bool = True, profile: Optional[ProfileKey] = None):
+    prompt = progress_week_prompt(user, week, feedback, week_goal, profile)
+    print(prompt)
+
+    return generate_text(prompt, model=route_model("progress_week", prompt), use_cache=use_cache, cacheable=has_workouts)
+
+
+async def progress_week_async(user: UserInfo, week: WorkoutWeek, feedback: UserFeedback, week_goal: ProgressType, use_cache: bool = True, profile: Optional[ProfileKey] = None):
+    """Non-blocking variant of `progress_week` for use inside the API."""
+    prompt = progress_week_prompt(user, week, feedback, week_goal, profile)
+    print(prompt)
+
+    return await generate_text_async(prompt, model=route_model("progress_week", prompt), use_cache=use_cache, cacheable=has_workouts)
+
+
+async def progress_week_or_fallback(
+    user: UserInfo,
+    week: WorkoutWeek,
+    feedback: UserFeedback,
+    week_goal: ProgressType,
+    engine: ProgressEngine = "llm",
+    use_cache: bool = True,
+    profile: Optional[ProfileKey] = None,
+) -> Tuple[WorkoutWeek, ProgressEngine, Optional[str]]:
+    """Progress a week with the chosen engine, returning the week, the engine
+    used and the model that served it (None for the rule engine).
+
+    The LLM path retries on the other model as `app.ai.routing` decides,
+    giving each its `settings.MODEL_TIMEOUT_SECONDS`, and falls back to the
+    rule engine in `app.progression` when the last model times out, fails or
+    gives no response that parses.
+    """
+    if engine == "llm":
+        prompt = progress_week_prompt(user, week, feedback, week_goal, profile)
+        print(prompt)
+        try:
+            days, model = await generate_routed("progress_week", prompt, require_workouts, use_cache=use_cache)
+            return WorkoutWeek(content=days), "llm", model
+        except ValueError:
+            print("No workouts could be parsed from the model response, using rules")
+        except asyncio.TimeoutError:
+            print("Model timed out progressing the week, using rules")
+        except Exception as e:
+            print(f"Model failed progressing the week ({e}), using rules")
+
+    return progress_week_rules(week, week_goal), "rules", None
+
+
+async def progress_week_by_day(
+    user: UserInfo,
+    week: WorkoutWeek,
+    week_goal: ProgressType,
+    concurrency: Optional[int] = None,
+    use_cache: bool = True,
+    profile: Optional[ProfileKey] = None,
+) -> Tuple[WorkoutWeek, Dict[str, str]]:
+    """Progress every day of a week with concurrent `progress_day` calls.
+
+    At most `concurrency` (default `settings.PROGRESS_DAY_CONCURRENCY`) calls
+    are in flight at once, each routed and retried as `app.ai.routing`
+    decides. Days come back in their original order; a day whose calls or
+    parses all fail is kept unchanged and its error is returned keyed by day.
+    """
+    semaphore = asyncio.Semaphore(concurrency or settings.PROGRESS_DAY_CONCURRENCY)
+
+    def parse_day(raw_day: str) -> WorkoutDay:
+        days = parse_workouts(raw_day)
+        if not days or not days[0].workout:
+            raise ValueError("No workouts could be parsed from the model response")
+        return days[0]
+
+    async def adjust(workout: WorkoutDay) -> WorkoutDay:
+        prompt = progress_day_prompt(user, workout, week_goal, profile)
+        async with semaphore:
+            day, _ = await generate_routed("progress_day", prompt, parse_day, use_cache=use_cache)
+        return day.model_copy(update={"day": workout.day, "date": workout.date})
+
+    results = await asyncio.gather(
+        *(adjust(workout) for workout in week.content), return_exceptions=True
+    )
 
+    content: List[WorkoutDay] = []
+    failures: Dict[str, str] = {}
+    for workout, result in zip(week.content, results):
+        if isinstance(result, Exception):
+            print(f"Failed to progress {workout.day}: {result}")
+            failures[workout.day] = str(result)
+            content.append(workout)
+        else:
+            content.append(result)
+    return WorkoutWeek(content=content), failures
 
 
 if __name__ == "__main__":
@@ -119,14 +132,12 @@ if __name__ == "__main__":
 
     with open(f"week_{week_num}.json", "r") as f:
         week = json.load(f)
-    week=[WorkoutDay(**obj) for obj in week]
+    week=WorkoutWeek(content=[WorkoutDay(**obj) for obj in week])
 
-    parsed_workouts = []
-    for workout in week:
-        w = progress_day(user=test_users[USER], workout=workout,week_goal="Increase")
-        print(w)
-        p = parse_workouts(w)
-        parsed_workouts.append(p[0])
+    progressed, failures = asyncio.run(
+        progress_week_by_day(user=test_users[USER], week=week, week_goal="Increase")
+    )
+    print(failures)
 
     with open(f"week_{week_num+1}.json", "w+") as f:
-        json.dump([d.model_dump() for d in parsed_workouts], f, indent=2)
\ No newline at end of file
+        json.dump([d.model_dump() for d in progressed.content], f, indent=2)
@@ -0,0 +1,209 @@
+"""Prompts for generating and progressing weeks.
+
+A prompt is static text around a few variable sections. The static text is
+rendered once at import. A user's sections (the trainer line and profile)
+are rendered once per profile version and cached: pass `profile=(user id,
+version)` to use the cache. A profile update bumps the version, so the old
+entry is simply replaced the next time the user's sections are needed. The
+same inputs always give the same bytes, so repeated prompts hit
+`app.ai.cache`.
+"""
+from typing import Callable, NamedTuple, Optional, Tuple
+from uuid import UUID
+
+from cachetools import LRUCache
+
+from app.ai.tokens import estimate_tokens
+from app.progression import ProgressType
+from app.settings import settings
+from app.user import UserFeedback, UserInfo, interests_prompt
+from app.workout import COMPACT_NOTATION, WorkoutDay, WorkoutWeek, compact_sets
+
+# (user id, profile version)
+ProfileKey = Tuple[UUID, int]
+
+RESPONSE_FORMAT = """
+Response should be comma seperated values
+Response should contain just workouts as CSV. No explanations or dialogues.
+"""
+
+WORKOUT_EXAMPLE = WorkoutDay.example()
+
+DIFFICULTY = {
+    "Deload": "drastically decrease intensity/volume.",
+    "Increase": "slightly add intensity/volume.",
+    "Decrease": "slightly lower intensity/volume.",
+    "Overload": "raise intensity/volume to the maximum safe amount.",
+}
+
+WEEK_NOTES = """
+# Make sure to follow the <Week Day>: <Workout as CSV> format, do not include column names
+# Make sure to balance exercises across days
+# Make sure to include exercises and activities that satisfy all of the user's interests
+# Try to put your self into the shoes of the user, workouts should have a logical rythym and flow
+
+"""
+
+PROGRESS_DAY_NOTES = """
+# Make sure to follow the <Week Day>: <Workout as CSV> format, do not include column names
+# CSV columns are exercise,amount,actual_amount,amount_unit,intensity,actual_intensity,intensity_unit
+# Always favor decreasing/increasing intensity or amount rather than adding or removing sets, this is less disruptive to the trainee
+"""
+
+PROGRESS_WEEK_FORMAT = f"""
+
+
+
+Workouts are in the following format:
+{WORKOUT_EXAMPLE}
+"""
+
+PROGRESS_WEEK_NOTES = """
+# Make sure to follow the <Week Day>: <Workout as CSV> format, do not include column names
+# Make sure to use the same week days from the previosue week
+# Remove/add exercises as needed to accomodate the user's feedback
+# Pay special attention to the user opinion on their interests and feedback on muscle groups
+# When adding or removing things, try to keep the same number of sets and reps as the previous week
+# Feel free to add new exercises, but make sure they are relevant to the user, 
+"""
+
+
+class UserSections(NamedTuple):
+    # "You are the <interests> trainer for the following user:" and the profile
+    intro: str
+    # "4 to 5"
+    workouts_per_week: str
+
+
+# user id -> (profile version, sections)
+_user_sections: LRUCache = LRUCache(maxsize=settings.PROMPT_CACHE_MAX_USERS)
+
+
+def difficulty_semantic(week_goal: ProgressType) -> str:
+    try:
+        return DIFFICULTY[week_goal]
+    except KeyError:
+        raise ValueError(f"Unknown ProgressType: {week_goal}") from None
+
+
+def render_user_sections(user: UserInfo) -> UserSections:
+    return UserSections(
+        intro=f"You are the {interests_prompt(user.interests)} trainer for the following user:\n{user.semantic()}",
+        workouts_per_week=f"{user.desired_workouts_per_week.start} to {user.desired_workouts_per_week.end}",
+    )
+
+
+def user_sections(user: UserInfo, profile: Optional[ProfileKey] = None) -> UserSections:
+    """The user's prompt sections, cached by profile version when `profile` is given."""
+    if profile is None:
+        return render_user_sections(user)
+    user_id, version = profile
+    cached = _user_sections.get(user_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    sections = render_user_sections(user)
+    _user_sections[user_id] = (version, sections)
+    return sections
+
+
+def fit_week(
+    week: WorkoutWeek, token_budget: int, estimate: Callable[[str], int] = estimate_tokens
+) -> str:
+    """The week in the compact notation, within `token_budget` estimated tokens
+    where it can be.
+
+    Days are shortened one at a time, longest first, to their per-exercise
+    summary, and only once every day is summarized to just their exercises,
+    until the week fits. Every day keeps its header, so the model still sees
+    which days the user trains on.
+    """
+    # Each day's renderings, most detailed first
+    levels = [
+        (lambda day=day: day.semantic() + "\n", lambda day=day: day.summary() + "\n", day.outline)
+        for day in week.content
+    ]
+    chosen = [0] * len(levels)
+    texts = [render[0]() for render in levels]
+    costs = [estimate(text) for text in texts]
+    total = sum(costs)
+    while total > token_budget:
+        shortenable = [i for i, level in enumerate(chosen) if level < 2]
+        if not shortenable:
+            break
+        i = min(shortenable, key=lambda i: (chosen[i], -costs[i]))
+        chosen[i] += 1
+        texts[i] = levels[i][chosen[i]]()
+        cost = estimate(texts[i])
+        total += cost - costs[i]
+        costs[i] = cost
+    return "".join(texts)
+
+
+def week_prompt(user: UserInfo, profile: Optional[ProfileKey] = None) -> str:
+    sections = user_sections(user, profile)
+    return f"""{RESPONSE_FORMAT}{sections.intro}
+Create a week's (total {sections.workouts_per_week}) worth of workouts in the following format:
+{WORKOUT_EXAMPLE}
+{WEEK_NOTES}"""
+
+
+def progress_day_prompt(
+    user: UserInfo, workout: WorkoutDay, week_goal: ProgressType, profile: Optional[ProfileKey] = None
+) -> str:
+    sections = user_sections(user, profile)
+    return f"""{RESPONSE_FORMAT}{sections.intro}
+
+Adjust the following workout to {difficulty_semantic(week_goal)}
+{COMPACT_NOTATION}
+{workout.day}:
+{compact_sets(workout.workout)}
+{PROGRESS_DAY_NOTES}"""
+
+
+def progress_week_prompt(
+    user: UserInfo,
+    week: WorkoutWeek,
+    feedback: UserFeedback,
+    week_goal: ProgressType,
+    profile: Optional[ProfileKey] = None,
+) -> str:
+    sections = user_sections(user, profile)
+    return f"""{RESPONSE_FORMAT}{sections.intro}{PROGRESS_WEEK_FORMAT}
+Overall, adjust the user's previous week to {difficulty_semantic(week_goal)}
+{PROGRESS_WEEK_NOTES}
+The user has the following feedback for the week:
+{feedback.semantic()}
+
+User's Previous week:
+{COMPACT_NOTATION}
+{fit_week(week, settings.PROMPT_WEEK_TOKEN_BUDGET)}
+"""
+
+
+if __name__ == "__main__":
+    import json
+    import time
+    import uuid
+
+    from app.user import test_users
+
+    with open("week_1.json", "r") as f:
+        week = WorkoutWeek(content=json.load(f))
+    user = test_users["josh"]
+    feedback = UserFeedback(biceps="Too much", calves="Not enough", interest_reports={"running": ["More volume"]})
+    profile = (uuid.uuid4(), 1)
+
+    def timed(fn, repeat=2000) -> float:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return (time.perf_counter() - start) / repeat * 1e6
+
+    for name, build in (
+        ("week_prompt", lambda p: week_prompt(user, profile=p)),
+        ("progress_day_prompt", lambda p: progress_day_prompt(user, week.content[0], "Increase", profile=p)),
+        ("progress_week_prompt", lambda p: progress_week_prompt(user, week, feedback, "Increase", profile=p)),
+    ):
+        assert build(None) == build(profile) == build(profile)
+        print(f"{name:<22} {timed(lambda: build(None)):8.1f} us uncached  {timed(lambda: build(profile)):8.1f} us cached")
+    print(f"UserFeedback.semantic() {timed(feedback.semantic):7.1f} us")
@@ -0,0 +1,98 @@
+"""Which model serves a generation task, and falling back to the other one.
+
+Each task starts on the model `settings.MODEL_ROUTES` names for it: Flash
+answers small, well-specified jobs (adjusting one day, re-asking for a
+malformed answer) several times faster than Pro, while the open-ended first
+week stays on Pro. Prompts estimated past `settings.MODEL_PRO_ABOVE_TOKENS`
+go to Pro whatever the task.
+
+`generate_routed` gives the first model `settings.MODEL_TIMEOUT_SECONDS` for
+its answer and retries once on the other model when that runs out, the
+call fails or the answer doesn't parse, so a cheaper first choice costs no
+parse success.
+"""
+import asyncio
+from typing import Callable, List, Literal, Tuple, TypeVar
+
+from app.ai.cache import llm_cache
+from app.ai.client import generate_text_async
+from app.ai.models import FLASH, MODEL, PRO
+from app.ai.tokens import estimate_tokens
+from app.metrics import LLM_FALLBACKS, LLM_TASKS
+from app.settings import settings
+
+TaskType = Literal["first_week", "progress_week", "progress_day", "repair"]
+
+T = TypeVar("T")
+
+
+def route_model(task: TaskType, prompt: str) -> str:
+    model = settings.MODEL_ROUTES.get(task, MODEL)
+    if model != PRO and estimate_tokens(prompt) > settings.MODEL_PRO_ABOVE_TOKENS:
+        return PRO
+    return model
+
+
+def fallback_model(model: str) -> str:
+    return FLASH if model == PRO else PRO
+
+
+def routed_models(task: TaskType, prompt: str) -> List[str]:
+    """Models to try for `prompt`, in order."""
+    model = route_model(task, prompt)
+    if not settings.MODEL_FALLBACK_ENABLED:
+        return [model]
+    return [model, fallback_model(model)]
+
+
+def model_timeout(model: str) -> float:
+    return settings.MODEL_TIMEOUT_SECONDS.get(model, settings.GENAI_TIMEOUT_SECONDS)
+
+
+def record_served(task: TaskType, model: str) -> None:
+    LLM_TASKS.labels(task, model).inc()
+
+
+def record_fallback(task: TaskType, model: str, reason: Literal["timeout", "error", "parse"]) -> None:
+    LLM_FALLBACKS.labels(task, model, reason).inc()
+
+
+async def generate_routed(
+    task: TaskType, prompt: str, parse: Callable[[str], T], use_cache: bool = True
+) -> Tuple[T, str]:
+    """Run `prompt` on the routed model and `parse` the answer, returning the
+    parsed result and the model that produced it.
+
+    `parse` raises ValueError for an unusable answer. Only answers that
+    parsed are stored in the response cache. If every model fails, the last
+    error is raised.
+    """
+    use_cache = use_cache and settings.LLM_CACHE_ENABLED
+    models = routed_models(task, prompt)
+    for i, model in enumerate(models):
+        last = i == len(models) - 1
+        cached = await llm_cache.get_async(model, prompt) if use_cache else None
+        try:
+            raw = cached if cached is not None else await asyncio.wait_for(
+                generate_text_async(prompt, model=model, use_cache=False),
+                timeout=model_timeout(model),
+            )
+        except Exception as e:
+            timed_out = isinstance(e, asyncio.TimeoutError)
+            record_fallback(task, model, "timeout" if timed_out else "error")
+            if last:
+                raise
+            print(f"{model} {'timed out' if timed_out else f'failed ({e})'} on {task}, retrying on {models[i + 1]}")
+            continue
+        try:
+            result = parse(raw)
+        except ValueError as e:
+            record_fallback(task, model, "parse")
+            if last:
+                raise
+            print(f"Couldn't parse {model}'s answer to {task} ({e}), retrying on {models[i + 1]}")
+            continue
+        if use_cache and cached is None:
+            await llm_cache.put_async(model, prompt, raw)
+        record_served(task, model)
+        return result, model
@@ -0,0 +1,18 @@
+"""Rough prompt token counts without calling the model's tokenizer.
+
+Gemini's tokenizer splits digits one per token and keeps common English
+words whole, so counting words, digits, punctuation and runs of padding
+lands close enough to budget prompt sections. It overestimates rather
+than under: long or rare words are charged one token per 6 letters.
+"""
+import re
+
+TOKEN_PIECES = re.compile(r"[A-Za-z]+|\d|\n|[ \t]{2,}|[^\w\s]|[^\W\d]+")
+
+
+def estimate_tokens(text: str) -> int:
+    tokens = 0
+    for piece in TOKEN_PIECES.findall(text):
+        tokens += (len(piece) + 5) // 6 if piece[0].isalpha() else 1
+    return tokens
+
@@ -1,51 +1,284 @@
 import re
-from typing import List
+from typing import Dict, Iterable, List, Optional
+from pydantic import BaseModel
+from app.metrics import PARSE_REJECTED, PARSE_SETS
 from app.workout import WorkoutDay, WorkDone
 
-def parse_workouts(raw_text: str) -> List[WorkoutDay]:
-    days: List[WorkoutDay] = []
-    week_days = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
-    # Regex to match each day and its block, even if the header is on the same line as the first workout
-    pattern = r'(' + '|'.join(day + ':' for day in week_days) + r')'
-    # Find all matches with their positions
-    matches = list(re.finditer(pattern, raw_text))
-    for idx, match in enumerate(matches):
-        day_header = match.group(0)[:-1]  # Remove the colon
-        start = match.end()
-        end = matches[idx + 1].start() if idx + 1 < len(matches) else len(raw_text)
-        workouts_block = raw_text[start:end].strip()
-        # Split lines, but also handle the case where the first workout is on the same line as the header
-        lines = []
-        if '\n' in workouts_block:
-            lines = [line.strip() for line in workouts_block.splitlines() if line.strip()]
-        else:
-            # All workouts are on one line, comma-separated
-            lines = [l.strip() for l in workouts_block.split(',') if l.strip()]
-            # Recombine every 8 fields into a workout line
-            lines = [','.join(lines[i:i+8]) for i in range(0, len(lines), 8)]
-        workout_objs = []
+WEEK_DAYS = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+DAY_HEADER = re.compile(r'(' + '|'.join(day + ':' for day in WEEK_DAYS) + r')')
+NUMBER = re.compile(r'[+-]?(?:\d+\.?\d*|\.\d+)')
+
+# exercise,amount,actual_amount,amount_unit,intensity,actual_intensity,intensity_unit[,perceived_exertion]
+REQUIRED_FIELDS = 7
+NUMERIC_FIELDS = {1: "amount", 2: "actual_amount", 4: "intensity", 5: "actual_intensity"}
+
+
+class RejectedLine(BaseModel):
+    line_number: int
+    line: str
+    reason: str
+    # Fixed label for the rejected-lines metric; `reason` has the details
+    kind: str
+
+
+class ParseResult(BaseModel):
+    days: List[WorkoutDay]
+    rejected: List[RejectedLine] = []
+
+
+def record_parse(result: ParseResult) -> None:
+    """Count a model response's parsed sets and rejected lines in the
+    metrics. Parsing doesn't, so checks like `has_workouts` that parse a
+    response again don't count it twice; call this once per response."""
+    PARSE_SETS.inc(sum(len(day.workout) for day in result.days))
+    for rejected in result.rejected:
+        PARSE_REJECTED.labels(rejected.kind).inc()
+
+
+def _is_number(field: str) -> bool:
+    return NUMBER.fullmatch(field) is not None
+
+
+def _starts_record(fields: List[str], i: int) -> bool:
+    # An exercise name followed by two numbers (amount, actual_amount)
+    return (
+        i + 2 < len(fields)
+        and not _is_number(fields[i])
+        and _is_number(fields[i + 1])
+        and _is_number(fields[i + 2])
+    )
+
+
+def _split_records(fields: List[str]) -> List[List[str]]:
+    """Split the fields of one line into 7 or 8 field records.
+
+    Several sets can end up on one line (typically right after a day
+    header). The optional 8th field belongs to the current record unless it
+    is where the next record starts.
+    """
+    records = []
+    i = 0
+    while i < len(fields):
+        if len(fields) - i < REQUIRED_FIELDS:
+            raise ValueError(f"expected at least {REQUIRED_FIELDS} fields, got {len(fields) - i}")
+        record = fields[i:i + REQUIRED_FIELDS]
+        i += REQUIRED_FIELDS
+        if i < len(fields) and not _starts_record(fields, i):
+            record.append(fields[i])
+            i += 1
+        records.append(record)
+    return records
+
+
+def _work_from_record(record: List[str]) -> WorkDone:
+    for index, name in NUMERIC_FIELDS.items():
+        if not _is_number(record[index]):
+            raise ValueError(f"{name} is not a number: {record[index]!r}")
+    return WorkDone(
+        exercise=record[0],
+        amount=float(record[1]),
+        actual_amount=float(record[2]),
+        amount_unit=record[3],
+        intensity=float(record[4]),
+        actual_intensity=float(record[5]),
+        intensity_unit=record[6],
+        perceived_exertion=record[7] if len(record) > 7 and record[7] else None,
+    )
+
+
+class WorkoutStreamParser:
+    """Single-pass parser for the `<Week Day>: <Workout as CSV>` format.
+
+    Feed it text as it arrives from the model; each call returns the days
+    that were completed by that text. A day is complete once the next day
+    header shows up, or when the stream is closed. Lines that aren't
+    workouts are collected in `rejected` with the reason.
+
+    A header repeating an earlier day continues that day, as in
+    `parse_compact_week` and `WorkoutWeek.merge_repeated_days`: the day is
+    returned again, with the added sets, when the repeat completes.
+    """
+
+    def __init__(self):
+        self.days: List[WorkoutDay] = []
+        self.rejected: List[RejectedLine] = []
+        self._pending: List[str] = []
+        self._line_number = 0
+        self._day: Optional[str] = None
+        self._workout: List[WorkDone] = []
+        self._by_name: Dict[str, WorkoutDay] = {}
+
+    def feed(self, text: str) -> List[WorkoutDay]:
+        lines = text.split("\n")
+        if len(lines) == 1:
+            self._pending.append(text)
+            return []
+        lines[0] = "".join(self._pending) + lines[0]
+        self._pending = [lines.pop()]
+
+        finished: List[WorkoutDay] = []
         for line in lines:
-            parts = [p.strip() for p in line.split(",")]
-            if len(parts) < 7:
-                continue  # skip malformed lines
+            finished.extend(self._consume_line(line))
+        return finished
+
+    def close(self) -> List[WorkoutDay]:
+        finished = self._consume_line("".join(self._pending))
+        self._pending = []
+        day = self._finish_day()
+        if day is not None:
+            finished.append(day)
+        return finished
+
+    def result(self) -> ParseResult:
+        return ParseResult(days=self.days, rejected=self.rejected)
+
+    def _consume_line(self, line: str) -> List[WorkoutDay]:
+        self._line_number += 1
+        finished: List[WorkoutDay] = []
+        # [text before first header, header, text after it, header, ...]
+        pieces = DAY_HEADER.split(line)
+        self._add_sets(pieces[0])
+        for header, rest in zip(pieces[1::2], pieces[2::2]):
+            day = self._finish_day()
+            if day is not None:
+                finished.append(day)
+            self._day = header[:-1]
+            self._add_sets(rest)
+        return finished
+
+    def _reject(self, text: str, reason: str, kind: str):
+        self.rejected.append(
+            RejectedLine(line_number=self._line_number, line=text, reason=reason, kind=kind)
+        )
+
+    def _add_sets(self, text: str):
+        text = text.strip()
+        if not text:
+            return
+        if self._day is None:
+            self._reject(text, "before any day header", "no_day")
+            return
+        try:
+            records = _split_records([f.strip() for f in text.split(",")])
+        except ValueError as e:
+            self._reject(text, str(e), "fields")
+            return
+        for record in records:
             try:
-                workout_objs.append(
-                    WorkDone(
-                        exercise=parts[0],
-                        amount=float(parts[1]),
-                        actual_amount=float(parts[2]),
-                        amount_unit=parts[3],
-                        intensity=float(parts[4]),
-                        actual_intensity=float(parts[5]),
-                        intensity_unit=parts[6] if parts[6] else ""
-                        #perceived_exertion=parts[7] if parts[7] else None
-                    )
-                )
-            except Exception as e:
-                print(f"Error parsing line: {line}\n{e}")
-        days.append(WorkoutDay(day=day_header, workout=workout_objs))
+                self._workout.append(_work_from_record(record))
+            except ValueError as e:
+                self._reject(",".join(record), str(e), "number")
+
+    def _finish_day(self) -> Optional[WorkoutDay]:
+        if self._day is None:
+            return None
+        day = self._by_name.get(self._day)
+        if day is None:
+            day = WorkoutDay(day=self._day, workout=self._workout)
+            self.days.append(day)
+            self._by_name[day.day] = day
+        elif self._workout:
+            day.workout.extend(self._workout)
+        else:
+            day = None
+        self._day = None
+        self._workout = []
+        return day
+
+
+def parse_workout_stream(chunks: Iterable[str]) -> ParseResult:
+    """Parse model output arriving as an iterable of text chunks."""
+    parser = WorkoutStreamParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.close()
+    return parser.result()
+
+
+# [N × ]amount[/actual] [unit][ @ intensity[/actual][ unit]], see app.workout.COMPACT_NOTATION
+_NUM = r'([+-]?(?:\d+\.?\d*|\.\d+)(?:e[+-]?\d+)?)'
+COMPACT_SET = re.compile(
+    rf'(?:(\d+) × )?{_NUM}(?:/{_NUM})?(?: (.*?))?(?: @ {_NUM}(?:/{_NUM})?(?: (.*))?)?'
+)
+COMPACT_BLOCK = re.compile(r'(\d+) × \((.*)\)')
+
+
+def _compact_sets(line: str) -> List[WorkDone]:
+    exercise, sep, specs = line.rpartition(": ")
+    if not sep:
+        raise ValueError("expected `Exercise: set, ...`")
+    sets = []
+    for spec in specs.split(", "):
+        match = COMPACT_SET.fullmatch(spec)
+        if match is None:
+            raise ValueError(f"not a set: {spec!r}")
+        reps, amount, actual_amount, amount_unit, intensity, actual_intensity, intensity_unit = match.groups()
+        work = WorkDone(
+            exercise=exercise,
+            amount=float(amount),
+            actual_amount=float(actual_amount or amount),
+            amount_unit=amount_unit or "",
+            intensity=float(intensity or 0),
+            actual_intensity=float(actual_intensity or 0),
+            intensity_unit=intensity_unit or "",
+        )
+        sets.extend(work.model_copy() for _ in range(int(reps or 1)))
+    return sets
+
+
+def parse_compact_week(text: str) -> List[WorkoutDay]:
+    """Read back `WorkoutWeek.semantic()` / `WorkoutDay.semantic()` output.
+
+    Only the fields the notation carries are set (perceived exertion and
+    done are left at their defaults). Raises ValueError on a malformed line.
+    """
+    days: Dict[str, WorkoutDay] = {}
+    current: Optional[WorkoutDay] = None
+    for line_number, line in enumerate(text.splitlines(), start=1):
+        line = line.strip()
+        if not line:
+            continue
+        if line[:-1] in WEEK_DAYS and line.endswith(":"):
+            # A repeated header continues the day it repeats
+            current = days.setdefault(line[:-1], WorkoutDay(day=line[:-1], workout=[]))
+            continue
+        if current is None:
+            raise ValueError(f"line {line_number}: before any day header")
+        try:
+            block = COMPACT_BLOCK.fullmatch(line)
+            if block is None:
+                current.workout.extend(_compact_sets(line))
+                continue
+            sets = [work for part in block.group(2).split("; ") for work in _compact_sets(part)]
+            for _ in range(int(block.group(1))):
+                current.workout.extend(work.model_copy() for work in sets)
+        except ValueError as e:
+            raise ValueError(f"line {line_number}: {e}") from None
+    return list(days.values())
+
+
+def parse_workouts(raw_text: str) -> List[WorkoutDay]:
+    result = parse_workout_stream([raw_text])
+    record_parse(result)
+    for rejected in result.rejected:
+        print(f"Skipped line {rejected.line_number} ({rejected.reason}): {rejected.line}")
+    return result.days
+
+
+def has_workouts(raw_text: str) -> bool:
+    """Whether any sets parse out of `raw_text`, without logging rejected
+    lines or counting them in the metrics."""
+    return any(day.workout for day in parse_workout_stream([raw_text]).days)
+
+
+def require_workouts(raw_text: str) -> List[WorkoutDay]:
+    """`parse_workouts`, raising ValueError when nothing could be parsed."""
+    days = parse_workouts(raw_text)
+    if not days:
+        raise ValueError("No workouts could be parsed from the model response")
     return days
 
+
 if __name__ == "__main__":
     day="""
 Tuesday: Dynamic Stretches,5.0,5.0,min,0.0,0.0,,0
@@ -62,4 +295,23 @@ Side Plank,35.0,0.0,seconds,0.0,0.0,,0
 Light Walk,5.0,5.0,min,0.0,0.0,bpm,0
 """
     p =parse_workouts(day)
-    print(p)
\ No newline at end of file
+    print(p)
+
+    # Linear-time check on synthetic multi-megabyte input, fed in 4 KB chunks:
+    # a week whose seven days each hold a seventh of the sets
+    import time
+
+    sets = day.split(":", 1)[1].lstrip()
+    sets_per_block = len(sets.splitlines())
+    previous = 0
+    for megabytes in (1, 2, 4, 8):
+        blocks = megabytes * 1024 * 1024 // (len(sets) * len(WEEK_DAYS)) + 1
+        text = "".join(f"{week_day}:\n" + sets * blocks for week_day in WEEK_DAYS)
+        chunks = [text[i:i + 4096] for i in range(0, len(text), 4096)]
+        start = time.perf_counter()
+        result = parse_workout_stream(chunks)
+        elapsed = time.perf_counter() - start
+        n_sets = sum(len(d.workout) for d in result.days)
+        assert not result.rejected and n_sets == len(WEEK_DAYS) * blocks * sets_per_block > previous
+        previous = n_sets
+        print(f"{megabytes} MB: {n_sets} sets in {elapsed:.2f} s ({megabytes / elapsed:.1f} MB/s)")
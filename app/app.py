@@ -1,3 +1,5 @@
+import asyncio
+
 from fastapi import FastAPI, Depends, HTTPException, status
 from typing import List
 from contextlib import asynccontextmanager
@@ -10,12 +12,22 @@ from app.auth import (
     create_access_token,
     get_current_user,
     verify_google_token,
+    google_certs,
+    GoogleCertsUnavailable,
+    require_metrics_token,
     Token,
 )
 from app.user import UserInfo, test_users  # Assuming you have a user model
 from app.routes.user import router as user_router
 from app.routes.workout import router as workout_router
-from app.db.models import User
+from app.routes.admin import router as admin_router
+from app.db.user import CachedUser
+from app.ai.client import init_client, close_client
+from app.jobs import start_workers, stop_workers
+from app.db.config import tortoise_config
+from app.db.migrate import ensure_schema
+from app.metrics import MetricsMiddleware, metrics_response
+from app.profiling import SlowRequestMiddleware
 
 from tortoise import Tortoise
 
@@ -30,16 +42,30 @@ async def lifespan(app: FastAPI):
     """
     # Startup: Initialize Tortoise ORM
     print("Connecting to the database...")
-    await Tortoise.init(
-        db_url='sqlite://db.sqlite3',
-        modules={'models': ['app.db.models']}
-    )
-    # Generate the database schemas
-    await Tortoise.generate_schemas()
+    await Tortoise.init(config=tortoise_config())
+    # Generate the database schemas and migrate legacy rows, unless the
+    # models haven't changed since that last ran
+    if await ensure_schema():
+        print("Database schema updated.")
     print("Database connection established.")
-    
+
+    # Startup: Create the shared Gemini client used by the generation routes.
+    # It is built in a thread so the slow google-genai import doesn't delay
+    # serving the first request.
+    client_ready = asyncio.create_task(asyncio.to_thread(init_client))
+    # Startup: Warm the Google signing key cache used by /auth/login/google
+    certs_ready = asyncio.create_task(google_certs.prefetch())
+    # Startup: Start the generation workers, resuming any unfinished jobs
+    await start_workers()
+
     yield  # The application is now running
-    
+
+    await stop_workers()
+    await client_ready
+    await certs_ready
+    await google_certs.close()
+    close_client()
+
     # Shutdown: Close Tortoise ORM connections
     print("Closing database connections...")
     await Tortoise.close_connections()
@@ -47,10 +73,19 @@ async def lifespan(app: FastAPI):
 
 # Pass the lifespan handler to the FastAPI app
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(SlowRequestMiddleware)
 
 # Register API routers
 app.include_router(user_router)
 app.include_router(workout_router)
+app.include_router(admin_router)
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(require_metrics_token)])
+async def metrics():
+    """Prometheus metrics for this process; see `app.metrics`. Scrapers
+    authenticate with `Authorization: Bearer <settings.METRICS_TOKEN>`."""
+    return metrics_response()
 
 class ProviderToken(BaseModel):
     token: str
@@ -62,7 +97,14 @@ class LoginRequest(BaseModel):
 
 @app.post("/auth/login/google", response_model=Token)
 async def login_with_google(provider_token: ProviderToken):
-    idinfo = verify_google_token(provider_token.token)
+    try:
+        idinfo = await verify_google_token(provider_token.token)
+    except GoogleCertsUnavailable as e:
+        print(e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Google sign-in is temporarily unavailable",
+        )
     if not idinfo:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -88,13 +130,13 @@ async def login_with_basic(creds: LoginRequest):
 
 # Example of a protected endpoint
 @app.get("/users/me", response_model=UserInfo)
-async def read_users_me(current_user: User = Depends(get_current_user)):
+async def read_users_me(current_user: CachedUser = Depends(get_current_user)):
     # In a real app, you'd return the full user object from the DB
     # For now, we just return the email from the token
     return {"name": "Dummy User", "email": current_user.email}
 
 @app.get("/week/my", response_model=List[WorkoutDay])
-def get_my_week(current_user: User = Depends(get_current_user)):
+def get_my_week(current_user: CachedUser = Depends(get_current_user)):
     # You can now use current_user.email to fetch data specific to that user
     # For now, returning sample data
     return [
@@ -1,17 +1,18 @@
+import asyncio
+import hmac
 import os
+import re
+import time
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from pydantic import BaseModel
 
-
-from google.oauth2 import id_token
-from google.auth.transport import requests
-
-from app.db.user import get_user_by_email
+from app.db.user import get_cached_user_by_email
+from app.profiling import phase
 
 from app.settings import settings
 
@@ -38,33 +39,167 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 # --- Token Verification (for your own tokens) ---
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)):
+    # Resolved at most once per request, even if called outside FastAPI's
+    # own per-request dependency cache
+    user = getattr(request.state, "user", None)
+    if user is not None:
+        return user
+
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+    with phase("auth"):
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+            email: str = payload.get("sub")
+            if email is None:
+                raise credentials_exception
+            token_data = TokenData(email=email)
+        except JWTError:
             raise credentials_exception
-        token_data = TokenData(email=email)
-    except JWTError:
-        raise credentials_exception
-    #Here you would fetch the user from your database
-    user = await get_user_by_email(email=token_data.email)
+        user = await get_cached_user_by_email(email=token_data.email)
     if user is None:
         raise credentials_exception
-    return user # In a real app, return the full user object
+    request.state.user = user
+    return user
+
+
+async def get_admin_user(user=Depends(get_current_user)):
+    """The current user, if their email is in `settings.ADMIN_EMAILS`."""
+    if user.email not in settings.ADMIN_EMAILS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin only")
+    return user
+
+
+def require_metrics_token(request: Request):
+    """Let through requests bearing `settings.METRICS_TOKEN`. With no token
+    configured the metrics aren't served at all."""
+    if not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    scheme, _, credentials = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(
+        credentials.encode(), settings.METRICS_TOKEN.encode()
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
 
 # --- Google Token Verification ---
-def verify_google_token(token: str) -> Optional[dict]:
+GOOGLE_ISSUERS = ["accounts.google.com", "https://accounts.google.com"]
+MAX_AGE = re.compile(r"max-age=(\d+)")
+
+
+class GoogleCertsUnavailable(Exception):
+    """Google's signing keys couldn't be fetched and none are cached."""
+
+
+class GoogleCertStore:
+    """In-memory cache of Google's ID token signing keys (JWKS).
+
+    Keys are kept for as long as the response's Cache-Control max-age allows
+    and refreshed in the background once most of that time has passed, so
+    logins only wait on the network when there are no usable keys at all.
+    """
+
+    def __init__(self, url: str, default_max_age: int = 3600):
+        self.url = url
+        self.default_max_age = default_max_age
+        self._keys: dict = {}
+        self._fetched_at = 0.0
+        self._refresh_at = 0.0
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._client = None
+
+    async def refresh(self, force: bool = False):
+        async with self._lock:
+            if not force and time.monotonic() < self._refresh_at:
+                return  # refreshed while we waited for the lock
+            import httpx
+
+            if self._client is None:
+                self._client = httpx.AsyncClient(timeout=10)
+            try:
+                response = await self._client.get(self.url)
+                response.raise_for_status()
+                keys = {key["kid"]: key for key in response.json()["keys"]}
+            except (httpx.HTTPError, KeyError, TypeError, ValueError) as e:
+                raise GoogleCertsUnavailable(f"Could not fetch Google certs: {e!r}") from e
+
+            match = MAX_AGE.search(response.headers.get("cache-control", ""))
+            max_age = int(match.group(1)) if match else self.default_max_age
+            now = time.monotonic()
+            self._keys = keys
+            self._fetched_at = now
+            self._refresh_at = now + max_age * 0.8
+            self._expires_at = now + max_age
+
+    async def prefetch(self):
+        """Refresh without raising; used at startup and for background refreshes."""
+        try:
+            await self.refresh()
+        except GoogleCertsUnavailable as e:
+            print(e)
+        except Exception as e:
+            print(f"Could not prefetch Google certs: {e}")
+
+    async def close(self):
+        if self._refresh_task is not None:
+            await asyncio.gather(self._refresh_task, return_exceptions=True)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get_key(self, kid: Optional[str]) -> Optional[dict]:
+        """The signing key for `kid`, or None if Google doesn't have it.
+
+        Raises GoogleCertsUnavailable when the keys have expired and can't be
+        fetched again.
+        """
+        now = time.monotonic()
+        if now >= self._expires_at:
+            await self.refresh()
+        elif now >= self._refresh_at and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self.prefetch())
+
+        if kid not in self._keys and time.monotonic() - self._fetched_at > 60:
+            # Keys may have rotated since the last fetch; the ones we have
+            # are still valid, so a failed refresh just means an unknown key
+            try:
+                await self.refresh(force=True)
+            except GoogleCertsUnavailable as e:
+                print(e)
+        return self._keys.get(kid)
+
+
+google_certs = GoogleCertStore(settings.GOOGLE_CERTS_URL)
+
+
+async def verify_google_token(token: str) -> Optional[dict]:
+    """Verify a Google ID token against the cached signing keys.
+
+    Returns None for an invalid token; raises GoogleCertsUnavailable when
+    the keys can't be fetched.
+    """
     try:
-        idinfo = id_token.verify_oauth2_token(
-            token, requests.Request(), settings.GOOGLE_CLIENT_ID
+        key = await google_certs.get_key(jwt.get_unverified_header(token).get("kid"))
+        if key is None:
+            return None
+        return jwt.decode(
+            token,
+            key,
+            algorithms=["RS256"],
+            audience=settings.GOOGLE_CLIENT_ID,
+            issuer=GOOGLE_ISSUERS,
+            # at_hash can only be checked against the access token, which we don't get
+            options={"verify_at_hash": False},
         )
-        return idinfo
-    except ValueError:
+    except JWTError:
         # Invalid token
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,116 @@
+from datetime import datetime, timedelta, timezone
+from uuid import UUID
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from tortoise.exceptions import DoesNotExist, IntegrityError
+from tortoise.expressions import Q
+
+from app.db import models
+from app.metrics import observe_db
+
+JobStatus = Literal["queued", "running", "done", "failed"]
+JobKind = Literal["generate", "progress"]
+
+
+@observe_db
+async def create_job(
+    user_id: UUID, kind: JobKind = "generate", params: Optional[Dict[str, Any]] = None
+) -> models.GenerationJob:
+    """Create a new queued generation job for a user."""
+    job = await models.GenerationJob.create(user_id=user_id, kind=kind, params=params)
+    return job
+
+
+@observe_db
+async def get_job(job_id: UUID) -> Optional[models.GenerationJob]:
+    """Retrieve a generation job by its ID."""
+    try:
+        return await models.GenerationJob.get(id=job_id)
+    except DoesNotExist:
+        return None
+
+
+@observe_db
+async def get_pending_job(user_id: UUID) -> Optional[models.GenerationJob]:
+    """Return the user's queued or running job, if there is one."""
+    return await models.GenerationJob.filter(
+        user_id=user_id, status__in=["queued", "running"]
+    ).first()
+
+
+async def get_or_create_pending_job(
+    user_id: UUID, kind: JobKind = "generate", params: Optional[Dict[str, Any]] = None
+) -> Tuple[models.GenerationJob, bool]:
+    """Return the user's pending job, of whatever kind, creating one if
+    there is none.
+
+    The flag is True when the job was created and still has to be enqueued.
+    The database allows one pending job per user (see
+    `app.db.migrate.add_pending_job_index`), so of concurrent requests, on
+    this instance or another, only one creates it.
+    """
+    while True:
+        job = await get_pending_job(user_id)
+        if job is not None:
+            return job, False
+        try:
+            return await create_job(user_id, kind, params), True
+        except IntegrityError:
+            # Another request created one first; it may already be done,
+            # so look again
+            continue
+
+
+@observe_db
+async def requeue_stale_jobs(lease_seconds: float) -> List[models.GenerationJob]:
+    """Reset running jobs whose heartbeat is older than `lease_seconds` to
+    queued, and return all queued jobs.
+
+    Jobs still running on another instance keep their heartbeat fresh and
+    are left alone. A queued job handed to several instances runs once, as
+    only one of them can move it to running.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=lease_seconds)
+    await models.GenerationJob.filter(
+        Q(heartbeat_at__lt=cutoff)
+        | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+        | Q(heartbeat_at__isnull=True, started_at__isnull=True),
+        status="running",
+    ).update(status="queued", started_at=None, heartbeat_at=None)
+    return await models.GenerationJob.filter(status="queued").order_by("created_at")
+
+
+@observe_db
+async def mark_job_running(job_id: UUID) -> Optional[models.GenerationJob]:
+    """Move a queued job to running. Returns None if it is no longer queued."""
+    now = datetime.now(timezone.utc)
+    updated = await models.GenerationJob.filter(id=job_id, status="queued").update(
+        status="running", started_at=now, heartbeat_at=now
+    )
+    if not updated:
+        return None
+    return await get_job(job_id)
+
+
+@observe_db
+async def touch_job(job_id: UUID) -> None:
+    """Refresh a running job's heartbeat."""
+    await models.GenerationJob.filter(id=job_id, status="running").update(
+        heartbeat_at=datetime.now(timezone.utc)
+    )
+
+
+@observe_db
+async def mark_job_done(job_id: UUID, chunk_id: UUID) -> None:
+    """Record a finished job and the chunk it produced."""
+    await models.GenerationJob.filter(id=job_id).update(
+        status="done", chunk_id=chunk_id, finished_at=datetime.now(timezone.utc)
+    )
+
+
+@observe_db
+async def mark_job_failed(job_id: UUID, error: str) -> None:
+    """Record a failed job and the reason."""
+    await models.GenerationJob.filter(id=job_id).update(
+        status="failed", error=error, finished_at=datetime.now(timezone.utc)
+    )
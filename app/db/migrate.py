@@ -0,0 +1,161 @@
+"""Schema setup, and moving workout chunks stored as a JSON blob into day
+and set rows.
+
+Runs at startup from the app lifespan when the models changed since the last
+run, and can be run by hand (always, regardless of the fingerprint) with
+
+    python -m app.db.migrate [db_url]
+"""
+import sys
+from hashlib import sha256
+from typing import Optional
+
+from tortoise import Tortoise, connections, run_async
+from tortoise.exceptions import OperationalError
+from tortoise.transactions import in_transaction
+from tortoise.utils import get_schema_sql
+
+from app.db import models
+from app.db.config import tortoise_config
+from app.db.workout import write_workout_week
+from app.workout import WorkoutWeek
+
+
+async def relax_legacy_workouts_column() -> None:
+    """Drop NOT NULL from `workoutchunk.workouts` on databases created before
+    it became nullable. `generate_schemas` never alters existing tables."""
+    conn = connections.get("default")
+    dialect = conn.capabilities.dialect
+
+    if dialect == "sqlite":
+        _, columns = await conn.execute_query("PRAGMA table_info(workoutchunk)")
+        if not any(c["name"] == "workouts" and c["notnull"] for c in columns):
+            return
+        # SQLite can't alter a column constraint, so rebuild the table
+        _, rows = await conn.execute_query(
+            "SELECT type, sql FROM sqlite_master WHERE tbl_name = 'workoutchunk' AND sql IS NOT NULL"
+        )
+        table_sql = next(r["sql"] for r in rows if r["type"] == "table")
+        index_sql = [r["sql"] for r in rows if r["type"] == "index"]
+        new_sql = table_sql.replace('"workouts" JSON NOT NULL', '"workouts" JSON').replace(
+            '"workoutchunk"', '"workoutchunk_new"', 1
+        )
+        await conn.execute_script(
+            "PRAGMA foreign_keys=OFF;"
+            "BEGIN;"
+            f"{new_sql};"
+            "INSERT INTO workoutchunk_new SELECT * FROM workoutchunk;"
+            "DROP TABLE workoutchunk;"
+            "ALTER TABLE workoutchunk_new RENAME TO workoutchunk;"
+            + "".join(f"{sql};" for sql in index_sql)
+            + "COMMIT;"
+            "PRAGMA foreign_keys=ON;"
+        )
+    elif dialect == "postgres":
+        await conn.execute_script(
+            "ALTER TABLE workoutchunk ALTER COLUMN workouts DROP NOT NULL"
+        )
+
+
+# Columns added to existing tables, which `generate_schemas` never alters.
+# A definition that differs between databases is given per dialect.
+ADDED_COLUMNS = [
+    ("user", "version", "INT NOT NULL DEFAULT 1"),
+    ("workoutchunk", "version", "INT NOT NULL DEFAULT 1"),
+    ("workoutchunk", "model", "VARCHAR(64)"),
+    ("generationjob", "kind", "VARCHAR(16) NOT NULL DEFAULT 'generate'"),
+    ("generationjob", "params", {"sqlite": "JSON", "postgres": "JSONB"}),
+    ("generationjob", "heartbeat_at", {"sqlite": "TIMESTAMP", "postgres": "TIMESTAMPTZ"}),
+]
+
+
+async def add_missing_columns() -> None:
+    conn = connections.get("default")
+    dialect = conn.capabilities.dialect
+
+    for table, column, definition in ADDED_COLUMNS:
+        if isinstance(definition, dict):
+            definition = definition[dialect]
+        if dialect == "sqlite":
+            _, columns = await conn.execute_query(f'PRAGMA table_info("{table}")')
+            if any(c["name"] == column for c in columns):
+                continue
+            await conn.execute_script(f'ALTER TABLE "{table}" ADD COLUMN "{column}" {definition}')
+        elif dialect == "postgres":
+            await conn.execute_script(
+                f'ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS "{column}" {definition}'
+            )
+
+
+async def add_pending_job_index() -> None:
+    """Allow one queued or running generation job per user, which Tortoise
+    can't declare as it's a partial index. Extra pending jobs from before the
+    index are failed first, keeping each user's oldest."""
+    conn = connections.get("default")
+    await conn.execute_script(
+        "UPDATE generationjob SET status = 'failed', error = 'Superseded by an earlier pending job' "
+        "WHERE status IN ('queued', 'running') AND id NOT IN ("
+        "SELECT id FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY created_at, id) AS n "
+        "FROM generationjob WHERE status IN ('queued', 'running')) pending WHERE n = 1)"
+    )
+    await conn.execute_script(
+        "CREATE UNIQUE INDEX IF NOT EXISTS generationjob_one_pending_per_user "
+        "ON generationjob (user_id) WHERE status IN ('queued', 'running')"
+    )
+
+
+async def migrate_json_chunks() -> int:
+    """Write rows for every chunk still holding a JSON week. Returns the count."""
+    await relax_legacy_workouts_column()
+
+    migrated = 0
+    for chunk in await models.WorkoutChunk.filter(workouts__isnull=False):
+        async with in_transaction():
+            if not await models.WorkoutChunkDay.exists(chunk_id=chunk.id):
+                week = WorkoutWeek.model_validate(chunk.workouts).merge_repeated_days()
+                await write_workout_week(chunk, week)
+            chunk.workouts = None
+            await chunk.save(update_fields=["workouts"])
+        migrated += 1
+    return migrated
+
+
+def schema_fingerprint() -> str:
+    """Hash of the DDL for the current models on the default connection."""
+    return sha256(get_schema_sql(connections.get("default"), safe=False).encode()).hexdigest()
+
+
+async def schema_is_current(fingerprint: str) -> bool:
+    try:
+        state = await models.SchemaState.get_or_none(id=1)
+    except OperationalError:
+        # No schemastate table yet
+        return False
+    return state is not None and state.fingerprint == fingerprint
+
+
+async def ensure_schema(force: bool = False) -> bool:
+    """Create missing tables and indexes and migrate legacy chunks, unless
+    that already ran for the current models. Returns whether it ran."""
+    fingerprint = schema_fingerprint()
+    if not force and await schema_is_current(fingerprint):
+        return False
+
+    await Tortoise.generate_schemas()
+    await add_missing_columns()
+    await add_pending_job_index()
+    migrated = await migrate_json_chunks()
+    if migrated:
+        print(f"Migrated {migrated} workout chunks to day/set rows.")
+    await models.SchemaState.update_or_create(id=1, defaults={"fingerprint": fingerprint})
+    return True
+
+
+async def main(db_url: Optional[str]) -> None:
+    await Tortoise.init(config=tortoise_config(db_url))
+    await ensure_schema(force=True)
+    await Tortoise.close_connections()
+
+
+if __name__ == "__main__":
+    run_async(main(sys.argv[1] if len(sys.argv) > 1 else None))
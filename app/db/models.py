@@ -5,20 +5,98 @@ from app.user import UserInfo
 from app.workout import WorkoutWeek
 
 
+class VersionMismatch(Exception):
+    """A write expected a row version (from If-Match) that is no longer current."""
+
+
 class User(Model):
     id = fields.UUIDField(pk=True)
     email = fields.CharField(max_length=200, unique=True)
     info = fields.JSONField(field_type=UserInfo)
+    # Bumped on every profile update; part of the ETag
+    version = fields.IntField(default=1)
 
 
 class WorkoutChunk(Model):
     id = fields.UUIDField(pk=True)
     created_at = fields.DatetimeField(auto_now_add=True)
     completed_at = fields.DatetimeField(null=True)
-    # add a timestamp here for when it was created
-    # add a timestamp here for when it was done
-    workouts = fields.JSONField(field_type=WorkoutWeek)
+    # Legacy: weeks stored as one JSON blob before days and sets got their
+    # own tables. `app.db.migrate` moves these into rows and clears them.
+    workouts = fields.JSONField(field_type=WorkoutWeek, null=True)
     user = fields.ForeignKeyField('models.User', related_name='workout_chunks')
+    # Bumped whenever the chunk's days or sets change; part of the ETag
+    version = fields.IntField(default=1)
+    # Model that generated the week; null for rule-engine and legacy chunks
+    model = fields.CharField(max_length=64, null=True)
+
+    class Meta:
+        # Serves the newest-first, keyset-paginated history listing
+        indexes = (("user", "created_at"),)
+
+    def __str__(self):
+        return f"WorkoutChunk for user {self.user_id}"
+
+
+class WorkoutChunkDay(Model):
+    id = fields.IntField(pk=True)
+    chunk = fields.ForeignKeyField('models.WorkoutChunk', related_name='days')
+    position = fields.SmallIntField()
+    day = fields.CharField(max_length=9)
+    date = fields.DateField(null=True)
+
+    class Meta:
+        unique_together = (("chunk", "position"),)
+        indexes = (("chunk", "day"),)
+
+
+class WorkoutChunkSet(Model):
+    id = fields.IntField(pk=True)
+    # chunk and user are denormalized from the day so sets can be queried
+    # (and indexed) per chunk and per user without joins
+    chunk = fields.ForeignKeyField('models.WorkoutChunk', related_name='sets')
+    day = fields.ForeignKeyField('models.WorkoutChunkDay', related_name='sets')
+    user = fields.ForeignKeyField('models.User', related_name='workout_sets')
+    position = fields.SmallIntField()
+    exercise = fields.CharField(max_length=200)
+    amount = fields.FloatField()
+    actual_amount = fields.FloatField()
+    amount_unit = fields.CharField(max_length=50)
+    intensity = fields.FloatField()
+    actual_intensity = fields.FloatField()
+    intensity_unit = fields.CharField(max_length=50)
+    perceived_exertion = fields.CharField(max_length=50, null=True)
+    done = fields.BooleanField(null=True, default=False)
+
+    class Meta:
+        indexes = (("user", "exercise"), ("chunk", "day"))
+
+
+class GenerationJob(Model):
+    id = fields.UUIDField(pk=True)
+    status = fields.CharField(max_length=16, default="queued", index=True)
+    created_at = fields.DatetimeField(auto_now_add=True)
+    started_at = fields.DatetimeField(null=True)
+    # Refreshed while the job runs, see app.jobs
+    heartbeat_at = fields.DatetimeField(null=True)
+    finished_at = fields.DatetimeField(null=True)
+    error = fields.TextField(null=True)
+    # "generate" a week from the profile, or "progress" an existing chunk
+    kind = fields.CharField(max_length=16, default="generate")
+    # Progress jobs: the chunk_id to progress, week_goal and feedback
+    params = fields.JSONField(null=True)
+    user = fields.ForeignKeyField('models.User', related_name='generation_jobs')
+    chunk = fields.ForeignKeyField(
+        'models.WorkoutChunk', related_name='generation_jobs', null=True
+    )
 
     def __str__(self):
-        return f"WorkoutChunk for user {self.user_id}"
\ No newline at end of file
+        return f"GenerationJob {self.id} ({self.kind}, {self.status}) for user {self.user_id}"
+
+
+class SchemaState(Model):
+    """Fingerprint of the models the schema was last generated for, so
+    startup can skip schema generation when nothing changed."""
+
+    id = fields.IntField(pk=True)
+    fingerprint = fields.CharField(max_length=64)
@@ -1,18 +1,52 @@
 from uuid import UUID
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
 
+from cachetools import TTLCache
+from pydantic import BaseModel, ConfigDict
 from tortoise.exceptions import DoesNotExist
+from tortoise.expressions import F
 
 from app.db import models
+from app.metrics import observe_db
+from app.settings import settings
 from app.user import UserInfo
 
+# Users looked up by authenticated requests, keyed by email (the token
+# subject), as (id, email, version, dumped info). Entries expire after a short
+# TTL so other processes' profile updates show up, and are dropped right away
+# on local updates.
+_user_cache: TTLCache = TTLCache(
+    maxsize=settings.USER_CACHE_MAX_SIZE, ttl=settings.USER_CACHE_TTL_SECONDS
+)
+# Bumped by every invalidation. A miss only stores what it read if none
+# happened meanwhile, as the row may predate that update.
+_invalidations = 0
+user_cache_hits = 0
+user_cache_misses = 0
 
+CachedEntry = Tuple[UUID, str, int, Dict[str, Any]]
+
+
+class CachedUser(BaseModel):
+    """Read-only copy of a User row, as authenticated requests get it. Each
+    call builds its own, so requests never share one."""
+
+    model_config = ConfigDict(frozen=True)
+
+    id: UUID
+    email: str
+    info: UserInfo
+    version: int
+
+
+@observe_db
 async def create_user(email: str, info: UserInfo) -> models.User:
     """Create a new user in the database."""
     user = await models.User.create(email=email, info=info.model_dump())
     return user
 
 
+@observe_db
 async def get_user_by_email(email: str) -> Optional[models.User]:
     """Retrieve a user by email address."""
     try:
@@ -21,13 +55,63 @@ async def get_user_by_email(email: str) -> Optional[models.User]:
         return None
 
 
-async def update_user_profile(user_id: UUID, info: UserInfo) -> Optional[models.User]:
-    """Update the JSON profile for a user."""
+def _cached_user(entry: CachedEntry) -> CachedUser:
+    user_id, email, version, info = entry
+    return CachedUser(id=user_id, email=email, info=UserInfo.model_validate(info), version=version)
+
+
+async def get_cached_user_by_email(email: str) -> Optional[CachedUser]:
+    """Retrieve a user by email, going to the database only on a cache miss."""
+    global user_cache_hits, user_cache_misses
+    entry = _user_cache.get(email)
+    if entry is not None:
+        user_cache_hits += 1
+        return _cached_user(entry)
+
+    user_cache_misses += 1
+    invalidations = _invalidations
+    user = await get_user_by_email(email)
+    if user is None:
+        return None
+    entry = (user.id, user.email, user.version, user.info.model_dump())
+    if _invalidations == invalidations:
+        _user_cache[email] = entry
+    return _cached_user(entry)
+
+
+def invalidate_cached_user(email: str) -> None:
+    global _invalidations
+    _invalidations += 1
+    _user_cache.pop(email, None)
+
+
+def user_cache_stats() -> dict:
+    return {
+        "hits": user_cache_hits,
+        "misses": user_cache_misses,
+        "size": len(_user_cache),
+    }
+
+
+@observe_db
+async def update_user_profile(
+    user_id: UUID, info: UserInfo, expected_version: Optional[int] = None
+) -> Optional[models.User]:
+    """Update the JSON profile for a user.
+
+    With `expected_version`, raises VersionMismatch unless the profile is
+    still at that version.
+    """
     try:
         user = await models.User.get(id=user_id)
     except DoesNotExist:
         return None
 
-    user.info = info.model_dump()
-    await user.save()
+    users = models.User.filter(id=user_id)
+    if expected_version is not None:
+        users = users.filter(version=expected_version)
+    if not await users.update(info=info.model_dump(), version=F("version") + 1):
+        raise models.VersionMismatch(f"User {user_id} is not at version {expected_version}")
+    invalidate_cached_user(user.email)
+    await user.refresh_from_db()
     return user
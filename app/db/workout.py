@@ -1,22 +1,59 @@
+from collections import defaultdict
+from datetime import datetime
 from uuid import UUID
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 
 from tortoise.exceptions import DoesNotExist
+from tortoise.expressions import F, Q
+from tortoise.queryset import QuerySet
+from tortoise.transactions import in_transaction
 
 from app.db import models
-from app.workout import WorkoutWeek
+from app.metrics import observe_db
+from app.workout import WorkDone, WorkoutWeek
 
+SET_FIELDS = list(WorkDone.model_fields)
+# Everything but the legacy `workouts` JSON
+SUMMARY_FIELDS = ["id", "user_id", "created_at", "completed_at", "model"]
 
+
+@observe_db
+async def write_workout_week(chunk: models.WorkoutChunk, workouts: WorkoutWeek) -> None:
+    """Store a week as day and set rows under a chunk.
+
+    Raises ValueError if a day repeats, since sets are addressed by day name.
+    """
+    repeated = workouts.repeated_days()
+    if repeated:
+        raise ValueError(f"Each day may appear once; repeated: {', '.join(repeated)}")
+    sets = []
+    for position, workout_day in enumerate(workouts.content):
+        day = await models.WorkoutChunkDay.create(
+            chunk_id=chunk.id, position=position, day=workout_day.day, date=workout_day.date
+        )
+        for set_position, work in enumerate(workout_day.workout):
+            sets.append(models.WorkoutChunkSet(
+                chunk_id=chunk.id,
+                day_id=day.id,
+                user_id=chunk.user_id,
+                position=set_position,
+                **work.model_dump(),
+            ))
+    await models.WorkoutChunkSet.bulk_create(sets)
+
+
+@observe_db
 async def create_workout_chunk(
-    user_id: UUID, workouts: WorkoutWeek
+    user_id: UUID, workouts: WorkoutWeek, model: Optional[str] = None
 ) -> models.WorkoutChunk:
-    """Create a new workout chunk for a user."""
-    chunk = await models.WorkoutChunk.create(
-        user_id=user_id, workouts=workouts.model_dump()
-    )
+    """Create a new workout chunk for a user, noting the model that generated it."""
+    async with in_transaction():
+        chunk = await models.WorkoutChunk.create(user_id=user_id, model=model)
+        await write_workout_week(chunk, workouts)
     return chunk
 
 
+@observe_db
 async def get_workout_chunk(chunk_id: UUID) -> Optional[models.WorkoutChunk]:
     """Retrieve a workout chunk by its ID."""
     try:
@@ -25,14 +62,203 @@ async def get_workout_chunk(chunk_id: UUID) -> Optional[models.WorkoutChunk]:
         return None
 
 
+def user_workout_chunks(user_id: UUID) -> QuerySet[models.WorkoutChunk]:
+    """All workout chunks owned by a user. Lookups made on a user's behalf
+    start from here so they can never reach someone else's chunk."""
+    return models.WorkoutChunk.filter(user_id=user_id)
+
+
+@observe_db
+async def get_user_workout_chunk(
+    user_id: UUID, chunk_id: UUID
+) -> Optional[models.WorkoutChunk]:
+    """Retrieve a workout chunk by its ID, if it belongs to the user."""
+    return await user_workout_chunks(user_id).get_or_none(id=chunk_id)
+
+
+def workout_chunks_page(
+    user_id: UUID,
+    limit: int,
+    before: Optional[Tuple[datetime, UUID]] = None,
+    summary: bool = False,
+) -> QuerySet[models.WorkoutChunk]:
+    """A page of a user's chunks, newest first.
+
+    `before` is the (created_at, id) of the last chunk of the previous page.
+    Paging by key instead of offset walks the (user, created_at) index from
+    that point, so a page costs the same however far back it is.
+    """
+    query = user_workout_chunks(user_id)
+    if before is not None:
+        created_at, chunk_id = before
+        query = query.filter(created_at__lte=created_at).exclude(
+            Q(created_at=created_at) & Q(id__gte=chunk_id)
+        )
+    query = query.order_by("-created_at", "-id").limit(limit)
+    if summary:
+        query = query.only(*SUMMARY_FIELDS)
+    return query
+
+
+@observe_db
+async def list_workout_chunks(
+    user_id: UUID,
+    limit: int,
+    before: Optional[Tuple[datetime, UUID]] = None,
+    summary: bool = False,
+) -> List[models.WorkoutChunk]:
+    return await workout_chunks_page(user_id, limit, before=before, summary=summary)
+
+
+@observe_db
+async def get_workout_week_data(
+    chunks: List[models.WorkoutChunk],
+) -> Dict[UUID, dict]:
+    """The week of each chunk as plain dicts shaped like a dumped WorkoutWeek,
+    with one query for all the days and one for all the sets.
+
+    The rows were validated on the way in. Routes that only send them back
+    out serialize these directly instead of building models first.
+    """
+    chunk_ids = [chunk.id for chunk in chunks]
+    days = await models.WorkoutChunkDay.filter(chunk_id__in=chunk_ids).order_by(
+        "position"
+    ).values("id", "chunk_id", "day", "date")
+    sets = await models.WorkoutChunkSet.filter(chunk_id__in=chunk_ids).order_by(
+        "position"
+    ).values("day_id", *SET_FIELDS)
+
+    sets_by_day = defaultdict(list)
+    for row in sets:
+        sets_by_day[row.pop("day_id")].append(row)
+    days_by_chunk = defaultdict(list)
+    for day in days:
+        days_by_chunk[day["chunk_id"]].append(
+            {"day": day["day"], "date": day["date"], "workout": sets_by_day[day["id"]]}
+        )
+
+    weeks = {}
+    for chunk in chunks:
+        if chunk.id not in days_by_chunk and chunk.workouts is not None:
+            # Not migrated yet
+            weeks[chunk.id] = WorkoutWeek.model_validate(chunk.workouts).model_dump()
+        else:
+            weeks[chunk.id] = {"content": days_by_chunk[chunk.id]}
+    return weeks
+
+
+@observe_db
+async def get_workout_weeks(
+    chunks: List[models.WorkoutChunk],
+) -> Dict[UUID, WorkoutWeek]:
+    """Assemble the WorkoutWeek of each chunk from its day and set rows."""
+    # One validation call per week is cheaper than building each set model
+    return {
+        chunk_id: WorkoutWeek.model_validate(week)
+        for chunk_id, week in (await get_workout_week_data(chunks)).items()
+    }
+
+
+@observe_db
+async def get_workout_week(chunk: models.WorkoutChunk) -> WorkoutWeek:
+    """Assemble a chunk's WorkoutWeek from its day and set rows."""
+    return (await get_workout_weeks([chunk]))[chunk.id]
+
+
+@observe_db
+async def bump_chunk_version(chunk_id: UUID, expected_version: Optional[int] = None) -> None:
+    """Move a chunk to its next version, as part of a write.
+
+    With `expected_version` the bump only happens if the chunk is still at
+    that version, otherwise VersionMismatch is raised so the caller's
+    transaction rolls back.
+    """
+    chunks = models.WorkoutChunk.filter(id=chunk_id)
+    if expected_version is not None:
+        chunks = chunks.filter(version=expected_version)
+    if not await chunks.update(version=F("version") + 1):
+        raise models.VersionMismatch(f"Workout chunk {chunk_id} is not at version {expected_version}")
+
+
+@observe_db
+async def get_chunk_version(chunk_id: UUID) -> Optional[int]:
+    return await models.WorkoutChunk.filter(id=chunk_id).first().values_list("version", flat=True)
+
+
+@observe_db
 async def update_workout_chunk(
-    chunk_id: UUID, workouts: WorkoutWeek
+    chunk_id: UUID, workouts: WorkoutWeek, expected_version: Optional[int] = None
 ) -> Optional[models.WorkoutChunk]:
-    """Update the workouts JSON for a chunk."""
+    """Replace the days and sets of a chunk."""
     chunk = await get_workout_chunk(chunk_id)
     if not chunk:
         return None
 
-    chunk.workouts = workouts.model_dump()
-    await chunk.save()
+    async with in_transaction():
+        await bump_chunk_version(chunk.id, expected_version)
+        await models.WorkoutChunkSet.filter(chunk_id=chunk.id).delete()
+        await models.WorkoutChunkDay.filter(chunk_id=chunk.id).delete()
+        await write_workout_week(chunk, workouts)
+        if chunk.workouts is not None:
+            chunk.workouts = None
+            await chunk.save(update_fields=["workouts"])
+    await chunk.refresh_from_db(fields=["version"])
     return chunk
+
+
+@observe_db
+async def update_workout_set(
+    chunk_id: UUID, day: str, position: int, changes: dict,
+    expected_version: Optional[int] = None,
+) -> Optional[WorkDone]:
+    """Update only the given fields of one set, leaving the rest of the week alone."""
+    # Weeks stored before days had to be unique may repeat one; the first wins
+    day_row = await models.WorkoutChunkDay.filter(chunk_id=chunk_id, day=day).order_by("position").first()
+    if not day_row:
+        return None
+
+    sets = models.WorkoutChunkSet.filter(day_id=day_row.id, position=position)
+    if changes:
+        async with in_transaction():
+            updated = await sets.update(**changes)
+            if not updated:
+                return None
+            await bump_chunk_version(chunk_id, expected_version)
+    elif expected_version is not None and await get_chunk_version(chunk_id) != expected_version:
+        raise models.VersionMismatch(f"Workout chunk {chunk_id} is not at version {expected_version}")
+    row = await sets.first().values(*SET_FIELDS)
+    return WorkDone(**row) if row else None
+
+
+if __name__ == "__main__":
+    import time
+    from tortoise import Tortoise, connections, run_async
+
+    async def main():
+        await Tortoise.init(db_url="sqlite://:memory:", modules={"models": ["app.db.models"]})
+        await Tortoise.generate_schemas()
+        user = await models.User.create(email="bench@example.com", info={})
+        conn = connections.get("default")
+
+        # Page latency as the history grows; first page and one 90% back
+        total = 0
+        for size in (1_000, 5_000, 20_000):
+            await models.WorkoutChunk.bulk_create(
+                [models.WorkoutChunk(user_id=user.id) for _ in range(size - total)]
+            )
+            total = size
+            oldest = await user_workout_chunks(user.id).order_by("created_at", "id").offset(size // 10).first()
+            for label, before in (("first", None), ("deep", (oldest.created_at, oldest.id))):
+                start = time.perf_counter()
+                for _ in range(100):
+                    await list_workout_chunks(user.id, 21, before=before, summary=True)
+                elapsed = (time.perf_counter() - start) * 10
+                print(f"{size:>6} chunks, {label} page: {elapsed:.2f} ms")
+
+        query = workout_chunks_page(user.id, 21, before=(oldest.created_at, oldest.id), summary=True)
+        _, plan = await conn.execute_query(f"EXPLAIN QUERY PLAN {query.sql(params_inline=True)}")
+        for row in plan:
+            print(row["detail"])
+        await Tortoise.close_connections()
+
+    run_async(main())
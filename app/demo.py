@@ -1,9 +1,14 @@
 import argparse
+import asyncio
 import json
 from app.ai.first_week import generate_raw_week, parse_workouts
-from app.ai.progress_week import progress_day, progress_week
+from app.ai.progress_week import progress_day, progress_week, progress_week_async, progress_week_by_day, ProgressType
 from app.workout import WorkoutDay, WorkoutWeek
 from app.user import UserInfo, Interest, Range, UserFeedback
+from app.ai.cache import llm_cache
+from app.settings import settings
+from app.progression import LOAD_INCREMENTS, REP_UNITS, progress_week_rules
+from typing import Dict, get_args
 import pandas as pd
 
 josh = UserInfo(
@@ -77,15 +82,80 @@ josh_feedback=UserFeedback(
 
 )
 
+LB_PER_KG = 2.20462
+
+
+def day_totals(day: WorkoutDay):
+    """Lifting volume (reps × load, in lb) and mean load of a day's loaded
+    rep sets. Cardio, holds and bodyweight work are left out, as their
+    amounts and intensities aren't in comparable units."""
+    loads = [
+        (w.amount, w.intensity * (LB_PER_KG if w.intensity_unit.lower().startswith("kg") else 1.0))
+        for w in day.workout
+        if w.amount_unit.lower() in REP_UNITS and w.intensity_unit.lower() in LOAD_INCREMENTS and w.intensity > 0
+    ]
+    volume = sum(reps * load for reps, load in loads)
+    intensity = sum(load for _, load in loads) / len(loads) if loads else 0.0
+    return volume, intensity
+
+
+def pct_change(before: float, after: float) -> str:
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def what_if_summary(week: WorkoutWeek, variants: Dict[str, list]) -> pd.DataFrame:
+    """Per-day change in lifting volume and mean load of each variant against
+    the original week."""
+    rows = []
+    for day in week.content:
+        volume, intensity = day_totals(day)
+        row = {"day": day.day}
+        for name, days in variants.items():
+            match = next((d for d in days if d.day == day.day), None)
+            if match is None:
+                row[f"{name} vol"] = row[f"{name} int"] = "-"
+                continue
+            new_volume, new_intensity = day_totals(match)
+            row[f"{name} vol"] = pct_change(volume, new_volume)
+            row[f"{name} int"] = pct_change(intensity, new_intensity)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+async def what_if(week: WorkoutWeek, use_cache: bool = True) -> Dict[str, list]:
+    """Generate every ProgressType variant of the next week concurrently."""
+    goals = get_args(ProgressType)
+    responses = await asyncio.gather(
+        *(progress_week_async(josh, week, josh_feedback, week_goal=goal, use_cache=use_cache) for goal in goals),
+        return_exceptions=True,
+    )
+    variants = {}
+    for goal, response in zip(goals, responses):
+        if isinstance(response, Exception):
+            print(f"{goal} failed: {response}")
+            continue
+        variants[goal] = parse_workouts(response)
+    return variants
+
+
 def main():
     parser = argparse.ArgumentParser()
-    parser.add_argument("--mode", choices=["base", "next"], required=True, help="Mode: base or next")
-    parser.add_argument("--week-num", type=int, default=0, help="Week number for next mode")
+    parser.add_argument("--mode", choices=["base", "next", "whatif"], required=True, help="Mode: base, next, or whatif (all progress types side by side)")
+    parser.add_argument("--week-num", type=int, default=0, help="Week number for next/whatif mode")
     parser.add_argument("--convert-to-csv", action="store_true", help="Convert output to CSV")
+    parser.add_argument("--engine", choices=["llm", "rules"], default="llm", help="Progress with the model or the local rule engine (next mode)")
+    parser.add_argument("--per-day", action="store_true", help="Progress each day separately (concurrently) instead of the whole week at once")
+    parser.add_argument("--concurrency", type=int, default=None, help="Max concurrent day calls for --per-day")
+    parser.add_argument("--no-cache", action="store_true", help="Always call the model, ignoring cached responses")
     args = parser.parse_args()
+    use_cache = not args.no_cache
+    # The response cache is opt-in; the demo reruns the same prompts
+    settings.LLM_CACHE_ENABLED = use_cache
 
     if args.mode == "base":
-        raw_week = generate_raw_week(josh)
+        raw_week = generate_raw_week(josh, use_cache=use_cache)
         days = parse_workouts(raw_week)
         with open("week_1.json", "w") as f:
             json.dump([d.model_dump() for d in days], f, indent=2)
@@ -101,14 +171,19 @@ def main():
         week = [WorkoutDay(**obj) for obj in week]
         week = WorkoutWeek(content=week)
         
-        wk = progress_week(josh, week,josh_feedback, week_goal="Increase")
-        print(wk)
-        parsed_workouts = parse_workouts(wk)
-        #for workout in week:
-        #    w = progress_day(user=josh, workout=workout, week_goal="Increase")
-        #    print(w)
-        #    p = parse_workouts(w)
-        #    parsed_workouts.append(p[0])
+        if args.engine == "rules":
+            parsed_workouts = progress_week_rules(week, "Increase").content
+        elif args.per_day:
+            progressed, failures = asyncio.run(progress_week_by_day(
+                josh, week, week_goal="Increase", concurrency=args.concurrency, use_cache=use_cache
+            ))
+            for day, error in failures.items():
+                print(f"{day} kept unchanged: {error}")
+            parsed_workouts = progressed.content
+        else:
+            wk = progress_week(josh, week,josh_feedback, week_goal="Increase", use_cache=use_cache)
+            print(wk)
+            parsed_workouts = parse_workouts(wk)
 
         with open(f"week_{week_num+1}.json", "w") as f:
             json.dump([d.model_dump() for d in parsed_workouts], f, indent=2)
@@ -117,6 +192,19 @@ def main():
                 df = d.workout_df()
                 df.to_csv(f"week_{week_num+1}_day_{i+1}_{d.day}.csv", index=False)
 
+    elif args.mode == "whatif":
+        week_num = args.week_num
+        with open(f"week_{week_num}.json", "r") as f:
+            week = WorkoutWeek(content=[WorkoutDay(**obj) for obj in json.load(f)])
+
+        variants = asyncio.run(what_if(week, use_cache=use_cache))
+        for goal, days in variants.items():
+            with open(f"week_{week_num+1}_{goal}.json", "w") as f:
+                json.dump([d.model_dump() for d in days], f, indent=2)
+        print(what_if_summary(week, variants).to_string(index=False))
+
+    print(f"LLM cache: {llm_cache.stats()}")
+
 if __name__ == "__main__":
     import json
     with open("josh.json", "w") as f:
@@ -0,0 +1,68 @@
+"""Import-time budget for the API process.
+
+    python -m app.importtime [--budget-ms 1200] [--top 15]
+
+Imports `app.app` in a fresh interpreter under `python -X importtime`, prints
+the slowest modules and exits non-zero if startup goes over budget or
+eagerly imports a dependency that should only load on first use.
+"""
+import argparse
+import subprocess
+import sys
+from typing import List, NamedTuple
+
+# Heavy dependencies the API defers until a request actually needs them
+LAZY_MODULES = ["google.genai", "pandas", "google.oauth2", "google.auth", "requests"]
+
+
+class ImportTime(NamedTuple):
+    module: str
+    depth: int
+    self_us: int
+    cumulative_us: int
+
+
+def measure(module: str = "app.app") -> List[ImportTime]:
+    """Return the `-X importtime` breakdown for importing `module` from scratch."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True,
+    )
+    times = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        times.append(ImportTime(name.strip(), depth, int(self_us), int(cumulative_us)))
+    return times
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="app.app", help="Module to import")
+    parser.add_argument("--budget-ms", type=float, default=1200.0, help="Maximum total import time")
+    parser.add_argument("--top", type=int, default=15, help="How many of the slowest modules to list")
+    args = parser.parse_args()
+
+    times = measure(args.module)
+    total_ms = sum(t.cumulative_us for t in times if t.depth == 0) / 1000
+
+    print(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for t in sorted(times, key=lambda t: t.cumulative_us, reverse=True)[:args.top]:
+        print(f"{t.cumulative_us / 1000:14.1f} {t.self_us / 1000:8.1f}  {'  ' * t.depth}{t.module}")
+    print(f"\nimporting {args.module}: {total_ms:.0f} ms (budget {args.budget_ms:.0f} ms)")
+
+    ok = True
+    eager = [m for m in LAZY_MODULES if any(t.module == m for t in times)]
+    if eager:
+        print(f"FAIL: imported at startup but should be lazy: {', '.join(eager)}")
+        ok = False
+    if total_ms > args.budget_ms:
+        print("FAIL: import time over budget")
+        ok = False
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
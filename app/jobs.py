@@ -0,0 +1,131 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Set, Tuple
+from uuid import UUID
+
+from app.settings import settings
+from app.db import job as job_db
+from app.db import workout as workout_db
+from app.db.models import User
+from app.user import UserFeedback
+from app.workout import WorkoutWeek
+from app.ai.first_week import generate_week_async
+from app.ai.progress_week import progress_week_or_fallback
+
+# In-process generation queue. Job rows are persisted, so anything still
+# queued, or running on an instance that stopped sending heartbeats, is picked
+# back up by the reclaimer of any instance.
+_queue: Optional[asyncio.Queue] = None
+_queued: Set[UUID] = set()
+_workers: List[asyncio.Task] = []
+
+
+async def progress_job_week(user: User, params: Dict[str, Any]) -> Tuple[WorkoutWeek, Optional[str]]:
+    """Progress the chunk a progress job names with the LLM engine, which
+    falls back to the rule engine on its own."""
+    source = await workout_db.get_user_workout_chunk(user.id, UUID(params["chunk_id"]))
+    if source is None:
+        raise ValueError("Workout chunk to progress no longer exists")
+    week, _, model = await progress_week_or_fallback(
+        user.info,
+        await workout_db.get_workout_week(source),
+        UserFeedback.model_validate(params["feedback"]),
+        params["week_goal"],
+        engine="llm",
+        profile=(user.id, user.version),
+    )
+    return week, model
+
+
+async def run_job(job_id: UUID) -> None:
+    """Generate or progress a week for the job's user and store it as a new chunk."""
+    job = await job_db.mark_job_running(job_id)
+    if job is None:
+        return
+
+    heartbeat = asyncio.create_task(_heartbeat(job_id))
+    try:
+        user = await User.get(id=job.user_id)
+        if job.kind == "progress":
+            week, model = await progress_job_week(user, job.params)
+        else:
+            days, model = await generate_week_async(user=user.info, profile=(user.id, user.version))
+            week = WorkoutWeek(content=days)
+        chunk = await workout_db.create_workout_chunk(user.id, week, model=model)
+    except Exception as e:
+        print(f"Generation job {job_id} failed: {e}")
+        await job_db.mark_job_failed(job_id, str(e))
+        return
+    finally:
+        heartbeat.cancel()
+
+    await job_db.mark_job_done(job_id, chunk.id)
+
+
+async def _heartbeat(job_id: UUID) -> None:
+    while True:
+        await asyncio.sleep(settings.JOB_HEARTBEAT_SECONDS)
+        try:
+            await job_db.touch_job(job_id)
+        except Exception as e:
+            print(f"Couldn't refresh the heartbeat of generation job {job_id}: {e}")
+
+
+async def _worker() -> None:
+    while True:
+        job_id = await _queue.get()
+        try:
+            await run_job(job_id)
+        except Exception as e:
+            # Anything outside run_job's own handling (a database error marking
+            # the job) must not take the worker down with it
+            print(f"Generation job {job_id} crashed: {e}")
+            try:
+                await job_db.mark_job_failed(job_id, str(e))
+            except Exception as e:
+                print(f"Couldn't mark generation job {job_id} failed: {e}")
+        finally:
+            _queued.discard(job_id)
+            _queue.task_done()
+
+
+def enqueue(job_id: UUID) -> None:
+    """Hand a persisted job to the worker pool."""
+    if job_id not in _queued:
+        _queued.add(job_id)
+        _queue.put_nowait(job_id)
+
+
+async def reclaim_jobs() -> None:
+    """Queue jobs left over by this or another instance: queued jobs, and
+    running ones whose heartbeat is older than `settings.JOB_LEASE_SECONDS`."""
+    for job in await job_db.requeue_stale_jobs(settings.JOB_LEASE_SECONDS):
+        enqueue(job.id)
+
+
+async def _reclaimer() -> None:
+    while True:
+        await asyncio.sleep(settings.JOB_LEASE_SECONDS)
+        try:
+            await reclaim_jobs()
+        except Exception as e:
+            print(f"Couldn't reclaim generation jobs: {e}")
+
+
+async def start_workers() -> None:
+    """Start the worker pool and resume any jobs left over from a restart."""
+    global _queue
+    _queue = asyncio.Queue()
+    _queued.clear()
+    await reclaim_jobs()
+    for _ in range(settings.GENERATION_WORKERS):
+        _workers.append(asyncio.create_task(_worker()))
+    _workers.append(asyncio.create_task(_reclaimer()))
+
+
+async def stop_workers() -> None:
+    """Cancel the worker pool. Unfinished jobs stay persisted and are picked
+    up once their lease runs out."""
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
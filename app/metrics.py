@@ -0,0 +1,203 @@
+"""Prometheus metrics for the API, the database and the model calls.
+
+Everything is kept in this process, in prometheus_client's default
+registry, and served as text at `GET /metrics` for Prometheus (or curl) to
+scrape with `settings.METRICS_TOKEN` as a bearer token:
+
+- `http_request_duration_seconds{method,route,status}` from
+  `MetricsMiddleware`, labelled by route template rather than raw path
+- `db_query_duration_seconds{operation}` and `db_query_errors_total` for
+  the `app.db` functions wrapped in `observe_db`
+- `llm_request_duration_seconds{model,outcome}`, `llm_tokens_total` and
+  `llm_failures_total` from `LLMCall` in `app.ai.client`
+- `llm_tasks_total{task,model}` and `llm_fallbacks_total{task,model,reason}`
+  from the model routing in `app.ai.routing`
+- `workout_parse_sets_total` and `workout_parse_rejected_lines_total`,
+  once per model response, from `record_parse` in `app.ai.tools`
+- `cache_lookups_total{cache,result}`, read from the user and LLM caches'
+  own counters when scraped
+"""
+import asyncio
+import functools
+import time
+from typing import Any, Optional
+
+from fastapi import Response
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily
+from prometheus_client.registry import Collector
+
+from app.profiling import current_timings, phase
+
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency, by route template and status",
+    ["method", "route", "status"],
+)
+
+DB_QUERY_SECONDS = Histogram(
+    "db_query_duration_seconds",
+    "Latency of app.db operations",
+    ["operation"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+DB_QUERY_ERRORS = Counter(
+    "db_query_errors", "app.db operations that raised", ["operation", "error"]
+)
+
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_duration_seconds",
+    "Model call latency (cache hits excluded)",
+    ["model", "outcome"],
+    buckets=(0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 45.0, 60.0, 90.0, 120.0, 180.0),
+)
+LLM_TOKENS = Counter(
+    "llm_tokens", "Tokens reported by the model", ["model", "kind"]
+)
+LLM_FAILURES = Counter(
+    "llm_failures", "Model calls that raised or were cancelled", ["model", "error"]
+)
+
+LLM_TASKS = Counter(
+    "llm_tasks", "Generation tasks, by the model that served them", ["task", "model"]
+)
+LLM_FALLBACKS = Counter(
+    "llm_fallbacks", "Model attempts given up on for the other model", ["task", "model", "reason"]
+)
+
+PARSE_SETS = Counter(
+    "workout_parse_sets", "Sets parsed from model responses"
+)
+PARSE_REJECTED = Counter(
+    "workout_parse_rejected_lines", "Lines dropped while parsing model responses", ["reason"]
+)
+
+
+class CacheCollector(Collector):
+    """Hit and miss counts the caches already keep, read at scrape time."""
+
+    @staticmethod
+    def _family() -> CounterMetricFamily:
+        return CounterMetricFamily(
+            "cache_lookups", "Cache lookups by result", labels=["cache", "result"]
+        )
+
+    def describe(self):
+        # Lets the registry skip collect() at registration, when the caches'
+        # modules may still be importing this one
+        yield self._family()
+
+    def collect(self):
+        from app.ai.cache import llm_cache
+        from app.db.user import user_cache_stats
+
+        lookups = self._family()
+        user_stats = user_cache_stats()
+        lookups.add_metric(["user", "hit"], user_stats["hits"])
+        lookups.add_metric(["user", "miss"], user_stats["misses"])
+        llm_stats = llm_cache.stats()
+        lookups.add_metric(["llm", "memory_hit"], llm_stats["memory_hits"])
+        lookups.add_metric(["llm", "disk_hit"], llm_stats["disk_hits"])
+        lookups.add_metric(["llm", "miss"], llm_stats["misses"])
+        yield lookups
+
+
+REGISTRY.register(CacheCollector())
+
+
+class MetricsMiddleware:
+    """Times every HTTP request into HTTP_REQUEST_SECONDS.
+
+    Plain ASGI rather than `@app.middleware("http")`, so streamed responses
+    pass through untouched and are timed until their last byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500  # unless the app gets as far as starting a response
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router leaves the matched route in the scope
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.labels(
+                scope["method"], getattr(route, "path", "<unmatched>"), str(status)
+            ).observe(time.perf_counter() - start)
+
+
+def observe_db(fn):
+    """Time an async `app.db` function into DB_QUERY_SECONDS under its name."""
+    seconds = DB_QUERY_SECONDS.labels(fn.__name__)
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            with phase("db"):
+                return await fn(*args, **kwargs)
+        except Exception as e:
+            DB_QUERY_ERRORS.labels(fn.__name__, type(e).__name__).inc()
+            raise
+        finally:
+            seconds.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+class LLMCall:
+    """Records one model call: latency, token usage and failure.
+
+        with LLMCall(model) as call:
+            response = client.models.generate_content(...)
+            call.record_usage(response.usage_metadata)
+    """
+
+    def __init__(self, model: str):
+        self.model = model
+        self.start = 0.0
+        self.timings = current_timings()
+
+    def __enter__(self) -> "LLMCall":
+        if self.timings is not None:
+            self.timings.enter("llm")
+        self.start = time.perf_counter()
+        return self
+
+    def record_usage(self, usage: Optional[Any]) -> None:
+        if usage is None:
+            return
+        if usage.prompt_token_count:
+            LLM_TOKENS.labels(self.model, "prompt").inc(usage.prompt_token_count)
+        if usage.candidates_token_count:
+            LLM_TOKENS.labels(self.model, "response").inc(usage.candidates_token_count)
+        if usage.thoughts_token_count:
+            LLM_TOKENS.labels(self.model, "thoughts").inc(usage.thoughts_token_count)
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        outcome = "ok"
+        if exc_type is not None:
+            # asyncio.wait_for cancels the call when the caller times out
+            outcome = "cancelled" if issubclass(exc_type, asyncio.CancelledError) else "error"
+            LLM_FAILURES.labels(self.model, exc_type.__name__).inc()
+        LLM_REQUEST_SECONDS.labels(self.model, outcome).observe(time.perf_counter() - self.start)
+        if self.timings is not None:
+            self.timings.exit("llm")
+        return False
+
+
+def metrics_response() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,212 @@
+"""Where a request's time goes: per-phase timings, a slow-request log and an
+on-demand sampling profiler.
+
+`SlowRequestMiddleware` gives every request a `RequestTimings` that the
+auth dependency, `app.db` functions (via `observe_db`), model calls and
+response rendering charge their time to with `phase(name)`. Phases are
+exclusive: a database lookup inside the auth dependency counts as `db`,
+not both. Whatever is left is `handler` (route code, validation, the
+framework). Requests slower than `settings.SLOW_REQUEST_MS` are printed
+with that breakdown.
+
+`sample_stacks` is a sampling profiler: a thread that, only while a profile
+is running, reads every other thread's stack every few milliseconds. Its
+output is the collapsed-stack format (`root;caller;callee count` per line)
+that flamegraph.pl, speedscope and inferno read.
+"""
+import asyncio
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+from app.settings import settings
+
+PHASES = ["auth", "db", "llm", "serialization"]
+
+
+class RequestTimings:
+    def __init__(self):
+        self.phases: Dict[str, float] = defaultdict(float)
+        self._stack: List[str] = []
+        self._since = time.perf_counter()
+
+    def _charge(self):
+        now = time.perf_counter()
+        if self._stack:
+            self.phases[self._stack[-1]] += now - self._since
+        self._since = now
+
+    def enter(self, name: str):
+        self._charge()
+        self._stack.append(name)
+
+    def exit(self, name: str):
+        self._charge()
+        # Innermost first; tasks gathered within one request share the timings
+        # and can exit out of order
+        for i in range(len(self._stack) - 1, -1, -1):
+            if self._stack[i] == name:
+                del self._stack[i]
+                break
+
+
+_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _timings.get()
+
+
+class phase:
+    """Charge the time spent in a `with` block to `name` for the current request.
+
+    A no-op outside a request (startup, generation workers).
+    """
+
+    __slots__ = ("name", "timings")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.timings = _timings.get()
+
+    def __enter__(self):
+        if self.timings is not None:
+            self.timings.enter(self.name)
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if self.timings is not None:
+            self.timings.exit(self.name)
+        return False
+
+
+class SlowRequestMiddleware:
+    """Prints requests slower than `settings.SLOW_REQUEST_MS` (0 disables it)
+    with the time spent in each phase."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or settings.SLOW_REQUEST_MS <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _timings.set(timings)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _timings.reset(token)
+            elapsed = time.perf_counter() - start
+            if elapsed * 1000 >= settings.SLOW_REQUEST_MS:
+                print(f"Slow request: {scope['method']} {scope['path']} {status} {format_timings(timings, elapsed)}")
+
+
+def format_timings(timings: RequestTimings, elapsed: float) -> str:
+    handler = max(elapsed - sum(timings.phases.values()), 0.0)
+    parts = [f"{name} {timings.phases.get(name, 0.0) * 1000:.0f} ms" for name in PHASES]
+    return f"{elapsed * 1000:.0f} ms ({', '.join(parts)}, handler {handler * 1000:.0f} ms)"
+
+
+class ProfilerBusy(Exception):
+    """A profile is already running."""
+
+
+_profiling = False
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds: float, interval: float) -> Counter:
+    """Sample every other thread's stack for `seconds`, every `interval` seconds.
+
+    Returns a count per collapsed stack, rooted at the thread name.
+    """
+    me = threading.get_ident()
+    thread_names = {t.ident: t.name for t in threading.enumerate()}
+    labels: Dict[object, str] = {}
+    counts: Counter = Counter()
+
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = _frame_label(code).replace(";", ":")
+                stack.append(label)
+                frame = frame.f_back
+            if ident not in thread_names:
+                thread_names = {t.ident: t.name for t in threading.enumerate()}
+            stack.append(thread_names.get(ident, f"thread-{ident}"))
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return counts
+
+
+def collapsed(counts: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in sorted(counts.items()))
+
+
+async def profile(seconds: float, interval: float) -> str:
+    """Run `sample_stacks` off the event loop; one profile at a time."""
+    global _profiling
+    if _profiling:
+        raise ProfilerBusy()
+    _profiling = True
+    try:
+        counts = await asyncio.to_thread(sample_stacks, seconds, interval)
+    finally:
+        _profiling = False
+    return collapsed(counts)
+
+
+if __name__ == "__main__":
+    # Cost of the always-on part: timing phases in a request
+    async def request(n_phases: int):
+        token = _timings.set(RequestTimings())
+        for _ in range(n_phases):
+            with phase("db"):
+                pass
+        _timings.reset(token)
+
+    async def main():
+        for n in (0, 10):
+            start = time.perf_counter()
+            for _ in range(20000):
+                await request(n)
+            print(f"{n:>2} phases: {(time.perf_counter() - start) / 20000 * 1e6:.2f} us per request")
+
+        # The profiler against a busy loop
+        def busy():
+            end = time.perf_counter() + 1.0
+            while time.perf_counter() < end:
+                sum(i * i for i in range(1000))
+
+        worker = threading.Thread(target=busy, name="busy")
+        worker.start()
+        text = await profile(0.5, 0.005)
+        worker.join()
+        lines = text.splitlines()
+        print(f"{len(lines)} distinct stacks, {sum(int(l.rsplit(' ', 1)[1]) for l in lines)} samples")
+        print(max(lines, key=lambda l: int(l.rsplit(" ", 1)[1]))[-160:])
+
+    asyncio.run(main())
@@ -0,0 +1,180 @@
+import numpy as np
+from typing import Literal
+
+from app.workout import WorkoutWeek
+
+ProgressType = Literal["Deload", "Increase", "Decrease","Overload"]
+
+# (amount factor, intensity factor) applied for each goal
+GOAL_FACTORS = {
+    "Deload": (0.6, 0.85),
+    "Increase": (1.05, 1.05),
+    "Decrease": (0.9, 0.95),
+    "Overload": (1.15, 1.1),
+}
+
+# RPE is already a relative scale, so it moves by fixed steps instead
+RPE_STEPS = {
+    "Deload": -2.0,
+    "Increase": 0.5,
+    "Decrease": -0.5,
+    "Overload": 1.0,
+}
+
+# Smallest change worth programming for each unit (plates, dumbbells, ...),
+# under the spellings the model uses (units are matched lowercased)
+LOAD_INCREMENTS = {
+    "lb": 5.0,
+    "lbs": 5.0,
+    "kg": 2.5,
+    "kgs": 2.5,
+}
+AMOUNT_INCREMENTS = {
+    "rep": 1.0,
+    "reps": 1.0,
+    "reps_per_leg": 1.0,
+    "reps_per_arm": 1.0,
+    "reps_per_side": 1.0,
+    "m": 50.0,
+    "meter": 50.0,
+    "meters": 50.0,
+    "metres": 50.0,
+    "km": 0.5,
+    "kilometers": 0.5,
+    "mi": 0.25,
+    "mile": 0.25,
+    "miles": 0.25,
+}
+REP_UNITS = [unit for unit in AMOUNT_INCREMENTS if unit.startswith("rep")]
+# Timed sets progress only when they carry an intensity (a run at a heart
+# rate); warm-ups, stretches and holds are left as they are
+TIME_INCREMENTS = {
+    "min": 1.0,
+    "mins": 1.0,
+    "minutes": 1.0,
+    "sec": 5.0,
+    "secs": 5.0,
+    "seconds": 5.0,
+}
+BPM_RANGE = (60.0, 200.0)
+
+
+def _scale(values: np.ndarray, factor: float, increment: float) -> np.ndarray:
+    """Scale values and round to `increment`, moving at least one increment.
+
+    A value is kept instead when that move is more than twice the change
+    asked for (a 10 lb dumbbell to 15 on a 5% increase) or would take it
+    below one increment.
+    """
+    scaled = np.round(values * factor / increment) * increment
+    if factor > 1:
+        scaled = np.maximum(scaled, values + increment)
+    elif factor < 1:
+        scaled = np.minimum(scaled, values - increment)
+    too_far = np.abs(scaled - values) > 2 * values * abs(factor - 1)
+    return np.where(too_far | (scaled < increment), values, scaled)
+
+
+def progress_week_rules(week: WorkoutWeek, week_goal: ProgressType) -> WorkoutWeek:
+    """Progress a week mechanically, without calling a model.
+
+    Loaded sets (lbs/kg), heart-rate work (bpm) and RPE work progress through
+    intensity; everything else, and loads too light to move by a whole plate,
+    progresses through amount. A deload cuts both, while Increase and
+    Overload move every loaded set by at least one rep or one plate.
+    Units without a rule (attempts, bodyweight, ...) and timed sets without
+    an intensity are left alone.
+    """
+    if week_goal not in GOAL_FACTORS:
+        raise ValueError(f"Unknown ProgressType: {week_goal}")
+    amount_factor, intensity_factor = GOAL_FACTORS[week_goal]
+
+    sets = [work for day in week.content for work in day.workout]
+    if not sets:
+        return week.model_copy(deep=True)
+
+    amount = np.array([w.amount for w in sets], dtype=float)
+    intensity = np.array([w.intensity for w in sets], dtype=float)
+    amount_unit = np.array([w.amount_unit.lower() for w in sets])
+    intensity_unit = np.array([w.intensity_unit.lower() for w in sets])
+
+    new_amount = amount.copy()
+    new_intensity = intensity.copy()
+    has_intensity = intensity > 0
+
+    for unit, increment in LOAD_INCREMENTS.items():
+        mask = has_intensity & (intensity_unit == unit)
+        new_intensity[mask] = _scale(intensity[mask], intensity_factor, increment)
+    # A load too light to move by a whole plate progresses through reps
+    load_kept = np.isin(intensity_unit, list(LOAD_INCREMENTS)) & (new_intensity == intensity)
+
+    bpm = has_intensity & (intensity_unit == "bpm")
+    new_intensity[bpm] = np.clip(np.round(intensity[bpm] * intensity_factor), *BPM_RANGE)
+
+    rpe = has_intensity & (intensity_unit == "rpe")
+    new_intensity[rpe] = np.clip(np.round((intensity[rpe] + RPE_STEPS[week_goal]) * 2) / 2, 1.0, 10.0)
+
+    intensity_driven = has_intensity & np.isin(
+        intensity_unit, [*LOAD_INCREMENTS, "bpm", "rpe"]
+    )
+    scale_amount = ~intensity_driven | load_kept | (week_goal == "Deload")
+    for unit, increment in AMOUNT_INCREMENTS.items():
+        mask = scale_amount & (amount_unit == unit)
+        new_amount[mask] = _scale(amount[mask], amount_factor, increment)
+    for unit, increment in TIME_INCREMENTS.items():
+        mask = scale_amount & has_intensity & (amount_unit == unit)
+        new_amount[mask] = _scale(amount[mask], amount_factor, increment)
+
+    if amount_factor > 1:
+        # A growing goal moves every loaded set: a loaded set that neither
+        # step changed gets one more rep, or one more plate if it isn't
+        # counted in reps
+        stuck = load_kept & has_intensity & (new_amount == amount)
+        reps = stuck & np.isin(amount_unit, REP_UNITS)
+        new_amount[reps] = amount[reps] + 1.0
+        for unit, increment in LOAD_INCREMENTS.items():
+            mask = stuck & ~reps & (intensity_unit == unit)
+            new_intensity[mask] = intensity[mask] + increment
+
+    new_sets = iter(
+        work.model_copy(update={
+            "amount": float(a),
+            "actual_amount": float(a),
+            "intensity": float(i),
+            "actual_intensity": 0.0,
+            "done": False,
+        })
+        for work, a, i in zip(sets, new_amount, new_intensity)
+    )
+    return WorkoutWeek(content=[
+        day.model_copy(update={"workout": [next(new_sets) for _ in day.workout]})
+        for day in week.content
+    ])
+
+
+if __name__ == "__main__":
+    import json
+    import time
+
+    for path in ("week_1.json", "week_2.json"):
+        with open(path, "r") as f:
+            week = WorkoutWeek(content=json.load(f))
+        for goal in ("Increase", "Overload"):
+            before = [w for day in week.content for w in day.workout]
+            after = [w for day in progress_week_rules(week, goal).content for w in day.workout]
+            stuck = [
+                b.exercise for b, a in zip(before, after)
+                if b.intensity > 0 and b.intensity_unit.lower() in LOAD_INCREMENTS
+                and (a.amount, a.intensity) == (b.amount, b.intensity)
+            ]
+            assert not stuck, f"{path} {goal}: loaded sets left unchanged: {stuck}"
+
+    with open("week_1.json", "r") as f:
+        week = WorkoutWeek(content=json.load(f))
+
+    for goal in GOAL_FACTORS:
+        start = time.perf_counter()
+        progressed = progress_week_rules(week, goal)
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"{goal}: {elapsed:.2f} ms")
+        print(progressed.content[0].semantic())
@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+from app.auth import get_admin_user
+from app.profiling import ProfilerBusy, profile
+from app.settings import settings
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(get_admin_user)])
+
+
+@router.get("/profile", response_class=PlainTextResponse)
+async def profile_process(
+    seconds: float = Query(10.0, gt=0, le=settings.PROFILER_MAX_SECONDS),
+    interval_ms: float = Query(settings.PROFILER_INTERVAL_MS, ge=1, le=1000),
+) -> PlainTextResponse:
+    """Sample every thread of this process for `seconds` and return the
+    stacks in the collapsed format (`flamegraph.pl`, speedscope, inferno).
+
+    Requests keep being served while it runs; only one profile runs at a time.
+    """
+    try:
+        stacks = await profile(seconds, interval_ms / 1000)
+    except ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    return PlainTextResponse(
+        stacks, headers={"Content-Disposition": 'attachment; filename="profile.collapsed"'}
+    )
@@ -0,0 +1,56 @@
+"""ETags and conditional requests for versioned resources.
+
+A resource's ETag is its id and version counter, so it is known from the row
+alone: `If-None-Match` can be answered with a 304 before the body is loaded
+or serialized, and `If-Match` turns into a version check on the write.
+"""
+from typing import List, Optional
+from uuid import UUID
+
+from fastapi import HTTPException, Request, Response
+
+
+def etag(resource_id: UUID, version: int, variant: str = "") -> str:
+    """The ETag of a resource version; `variant` tells apart representations
+    of the same version, such as the MessagePack one."""
+    return f'"{resource_id}.{version}{"-" + variant if variant else ""}"'
+
+
+def precondition_failed() -> HTTPException:
+    return HTTPException(status_code=412, detail="Precondition failed")
+
+
+def _tags(header: str) -> List[str]:
+    return [tag.strip() for tag in header.split(",")]
+
+
+def not_modified(request: Request, tag: str) -> Optional[Response]:
+    """A 304 response if the client's If-None-Match already has `tag`."""
+    header = request.headers.get("if-none-match")
+    if header is None:
+        return None
+    # If-None-Match uses the weak comparison
+    tags = {t[2:] if t.startswith("W/") else t for t in _tags(header)}
+    if "*" in tags or tag in tags:
+        return Response(status_code=304, headers={"ETag": tag})
+    return None
+
+
+def if_match_version(request: Request, resource_id: UUID) -> Optional[int]:
+    """The version an If-Match header requires the resource to be at.
+
+    None when there is no If-Match (or it is `*`, and the resource exists).
+    Raises 412 when none of the tags can belong to this resource.
+    """
+    header = request.headers.get("if-match")
+    if header is None or header.strip() == "*":
+        return None
+    # If-Match uses the strong comparison, so weak tags never match
+    prefix = f'"{resource_id}.'
+    for tag in _tags(header):
+        if tag.startswith(prefix) and tag.endswith('"'):
+            try:
+                return int(tag[len(prefix):-1].partition("-")[0])
+            except ValueError:
+                continue
+    raise precondition_failed()
@@ -0,0 +1,137 @@
+"""Fast JSON responses for data that is already valid.
+
+FastAPI validates whatever a route returns against its `response_model`,
+then serializes it, then encodes it. For rows we wrote and validated
+ourselves, or models we just validated, that is pure overhead. Routes return
+a `TrustedJSONResponse` of plain dicts straight from the database, or
+`json_response(model)`: one dump through a cached TypeAdapter and one
+`orjson.dumps`. `response_model` stays on the routes for the docs.
+"""
+from functools import lru_cache
+from typing import Any, Optional
+
+import orjson
+from fastapi import Response
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter
+
+from app import wire
+from app.profiling import phase
+
+
+class TrustedJSONResponse(ORJSONResponse):
+    # Match pydantic's "Z" suffix for UTC datetimes
+    def render(self, content: Any) -> bytes:
+        with phase("serialization"):
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+
+
+class MsgpackResponse(Response):
+    """MessagePack counterpart of TrustedJSONResponse; see `app.wire`."""
+
+    media_type = wire.MSGPACK_MEDIA_TYPE
+
+    def render(self, content: Any) -> bytes:
+        with phase("serialization"):
+            return wire.pack(content)
+
+
+@lru_cache(maxsize=None)
+def type_adapter(type_: Any) -> TypeAdapter:
+    """TypeAdapters build a validator and serializer; build each one once."""
+    return TypeAdapter(type_)
+
+
+def json_response(
+    content: Any,
+    type_: Any = None,
+    status_code: int = 200,
+    headers: Optional[dict] = None,
+) -> TrustedJSONResponse:
+    """Serialize `content` (a model, or a list of them with `type_` given)
+    without validating it again."""
+    adapter = type_adapter(type_ or type(content))
+    with phase("serialization"):
+        content = adapter.dump_python(content)
+    return TrustedJSONResponse(content, status_code=status_code, headers=headers)
+
+
+if __name__ == "__main__":
+    import asyncio
+    import json
+    import time
+    import uuid
+    from datetime import datetime, timezone
+
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_model_field
+
+    from app.routes.workout import WorkoutChunkOut, WorkoutChunkPage, chunk_summary_data
+    from app.workout import WorkDone, WorkoutDay, WorkoutWeek
+
+    with open("week_1.json", "r") as f:
+        week = WorkoutWeek(content=json.load(f))
+    # 30 sets over the week's days, as rows come out of the database
+    days, remaining = [], 30
+    for d in week.content:
+        rows = [w.model_dump() for w in d.workout[:remaining]]
+        remaining -= len(rows)
+        days.append((d.day, d.date, rows))
+
+    class Chunk:
+        def __init__(self):
+            self.id = uuid.uuid4()
+            self.created_at = datetime.now(timezone.utc)
+            self.completed_at = None
+            self.model = None
+
+    # FastAPI builds these once per route
+    fields = {
+        model: create_model_field("response", model, mode="serialization")
+        for model in (WorkoutChunkOut, WorkoutChunkPage)
+    }
+
+    async def default_path(n_weeks: int) -> bytes:
+        # Models built from the rows, then FastAPI's response_model
+        # validation and serialization, then json.dumps
+        items = [
+            WorkoutChunkOut(
+                id=c.id,
+                created_at=c.created_at,
+                workouts=WorkoutWeek(content=[
+                    WorkoutDay(day=day, date=date, workout=[WorkDone(**row) for row in rows])
+                    for day, date, rows in days
+                ]),
+            )
+            for c in (Chunk() for _ in range(n_weeks))
+        ]
+        content = WorkoutChunkPage(items=items) if n_weeks > 1 else items[0]
+        field = fields[type(content)]
+        return JSONResponse(await serialize_response(field=field, response_content=content)).body
+
+    async def fast_path(n_weeks: int) -> bytes:
+        items = [
+            {
+                **chunk_summary_data(c),
+                "workouts": {"content": [
+                    {"day": day, "date": date, "workout": [dict(row) for row in rows]}
+                    for day, date, rows in days
+                ]},
+            }
+            for c in (Chunk() for _ in range(n_weeks))
+        ]
+        content = {"items": items, "next_cursor": None} if n_weeks > 1 else items[0]
+        return TrustedJSONResponse(content).body
+
+    async def main():
+        for label, n_weeks, repeat in (("30-set week", 1, 2000), ("year of history", 52, 40)):
+            for name, path in (("default", default_path), ("fast", fast_path)):
+                body = await path(n_weeks)  # warm up
+                start = time.perf_counter()
+                for _ in range(repeat):
+                    body = await path(n_weeks)
+                elapsed = (time.perf_counter() - start) / repeat * 1000
+                print(f"{label:<16} {name:<8} {elapsed:8.3f} ms/request  {len(body)} bytes")
+
+    asyncio.run(main())
@@ -1,6 +1,6 @@
 from uuid import UUID
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
 from pydantic import BaseModel, EmailStr
 
 from app.auth import (
@@ -9,8 +9,11 @@ from app.auth import (
 
 
 from app.user import UserInfo
-from app.db.models import User
+from app.db.models import VersionMismatch
+from app.db.user import CachedUser
 import app.db.user as user_db
+from app.routes.responses import TrustedJSONResponse, json_response
+from app.routes.conditional import etag, if_match_version, not_modified, precondition_failed
 
 
 class UserCreate(BaseModel):
@@ -32,7 +35,7 @@ class UserOut(UserCreate):
     id: UUID
 
 
-router = APIRouter(prefix="/users", tags=["users"])
+router = APIRouter(prefix="/users", tags=["users"], default_response_class=TrustedJSONResponse)
 
 
 #@router.post("/", response_model=UserOut)
@@ -44,23 +47,39 @@ router = APIRouter(prefix="/users", tags=["users"])
 
 
 @router.get("/", response_model=UserOut)
-async def read_user(current_user: User = Depends(get_current_user)) -> UserOut:
-    """Retrieve a user by email."""
+async def read_user(request: Request, current_user: CachedUser = Depends(get_current_user)) -> Response:
+    """Retrieve the current user. Answers a matching `If-None-Match` with 304."""
 
-    user = await user_db.get_user_by_email(current_user)
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-
-    return UserOut(id=user.id, email=user.email, info=User(**user.info))
+    tag = etag(current_user.id, current_user.version)
+    if cached := not_modified(request, tag):
+        return cached
+    return json_response(
+        UserOut.model_construct(id=current_user.id, email=current_user.email, info=current_user.info),
+        headers={"ETag": tag},
+    )
 
 
 @router.put("/", response_model=UserOut)
-async def update_user(payload: UserUpdate, current_user: User = Depends(get_current_user)) -> UserOut:
-    """Update the profile for an existing user."""
-
-    updated = await user_db.update_user_profile(current_user.id, payload.info)
+async def update_user(
+    payload: UserUpdate, request: Request, current_user: CachedUser = Depends(get_current_user)
+) -> Response:
+    """Update the profile for an existing user.
+
+    With `If-Match`, fails with 412 if the profile changed since that ETag.
+    """
+
+    try:
+        updated = await user_db.update_user_profile(
+            current_user.id, payload.info,
+            expected_version=if_match_version(request, current_user.id),
+        )
+    except VersionMismatch:
+        raise precondition_failed()
     if not updated:
         raise HTTPException(status_code=404, detail="User not found")
 
-    return UserOut(id=updated.id, email=updated.email, info=payload.info)
+    return json_response(
+        UserOut.model_construct(id=updated.id, email=updated.email, info=payload.info),
+        headers={"ETag": etag(updated.id, updated.version)},
+    )
 
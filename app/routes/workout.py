@@ -1,9 +1,15 @@
+import asyncio
+import base64
+import binascii
+import json
 from datetime import datetime
 from uuid import UUID
-from typing import Optional
+from typing import List, Optional, Tuple, Union
 
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, field_validator, model_validator
+from tortoise.transactions import in_transaction
 
 from app.auth import (
 
@@ -13,12 +19,29 @@ from app.auth import (
 
 from app.db import user as user_db
 from app.db import workout as workout_db
-from app.db.models import User
-from app.workout import WorkoutWeek
-from app.user import UserInfo
+from app.db import job as job_db
+from app.db.models import VersionMismatch
+from app.db.user import CachedUser
+from app.workout import WorkDone, WorkoutWeek, WeekDay
+from app.user import UserInfo, UserFeedback
+from app.settings import settings
+from app.progression import ProgressType
+from app.routes.responses import MsgpackResponse, TrustedJSONResponse, json_response
+from app.routes.conditional import etag, if_match_version, not_modified, precondition_failed
+
+from app import jobs, wire
+from app.ai.first_week import generate_raw_week_stream
+from app.ai.prompts import week_prompt
+from app.ai.routing import model_timeout, record_fallback, record_served, routed_models
+from app.ai.tools import WorkoutStreamParser, record_parse
+from app.ai.progress_week import ProgressEngine, progress_week_or_fallback
+
+def reject_repeated_days(workouts: WorkoutWeek) -> WorkoutWeek:
+    repeated = workouts.repeated_days()
+    if repeated:
+        raise ValueError(f"Each day may appear once; repeated: {', '.join(repeated)}")
+    return workouts
 
-from app.ai.first_week import generate_raw_week, parse_workouts
-from app.ai.progress_week import progress_week
 
 class WorkoutChunkCreate(BaseModel):
     """Payload for creating a workout chunk."""
@@ -26,75 +49,466 @@ class WorkoutChunkCreate(BaseModel):
     user_id: UUID
     workouts: WorkoutWeek
 
+    _unique_days = field_validator("workouts")(reject_repeated_days)
+
 
 class WorkoutChunkUpdate(BaseModel):
     """Payload for updating a workout chunk."""
 
     workouts: WorkoutWeek
 
+    _unique_days = field_validator("workouts")(reject_repeated_days)
+
+
+class WorkoutSetPatch(BaseModel):
+    """Fields to change on a single set. Omitted fields are left as they are."""
+
+    exercise: Optional[str] = None
+    amount: Optional[float] = None
+    actual_amount: Optional[float] = None
+    amount_unit: Optional[str] = None
+    intensity: Optional[float] = None
+    actual_intensity: Optional[float] = None
+    intensity_unit: Optional[str] = None
+    perceived_exertion: Optional[str] = None
+    done: Optional[bool] = None
+
+    @model_validator(mode="after")
+    def no_null_required_fields(self):
+        for name in self.model_fields_set - {"perceived_exertion", "done"}:
+            if getattr(self, name) is None:
+                raise ValueError(f"{name} cannot be null")
+        return self
+
+
+class WorkoutSetBatchPatch(WorkoutSetPatch):
+    """A set patch addressed by day and set index, for batch updates."""
+
+    day: WeekDay
+    index: int
 
-class WorkoutChunkOut(BaseModel):
-    """Representation of a workout chunk returned by the API."""
+
+class WorkoutChunkSummary(BaseModel):
+    """A workout chunk without its workouts, for history listings."""
 
     id: UUID
-    workouts: WorkoutWeek
     created_at: datetime
     completed_at: Optional[datetime] = None
+    # Model that generated the week; null for rule-engine and older chunks
+    model: Optional[str] = None
+
 
+class WorkoutChunkOut(WorkoutChunkSummary):
+    """Representation of a workout chunk returned by the API."""
 
-router = APIRouter(prefix="/workouts", tags=["workouts"])
+    workouts: WorkoutWeek
 
 
-@router.post("/", response_model=WorkoutChunkOut)
-async def create_workout_chunk(from_scratch: bool = False, current_user: User = Depends(get_current_user)) -> WorkoutChunkOut:
-    """Create a new workout chunk for a user."""
+class WorkoutChunkPage(BaseModel):
+    """One page of a user's workout history, newest first.
 
-    raw_week = generate_raw_week(user=current_user.info)
-    week = parse_workouts(raw_text=raw_week)
-    workout_week = WorkoutWeek(content=week)
-    chunk = await workout_db.create_workout_chunk(
-        current_user.id, workout_week
-    )
-    return WorkoutChunkOut(
-        id=chunk.id,
-        workouts=workout_week,
-        created_at=chunk.created_at,
-        completed_at=chunk.completed_at,
+    Pass `next_cursor` back as `cursor` to get the following page; it is
+    null on the last page.
+    """
+
+    items: List[Union[WorkoutChunkOut, WorkoutChunkSummary]]
+    next_cursor: Optional[str] = None
+
+
+class GenerationJobOut(BaseModel):
+    """Representation of a background generation job returned by the API."""
+
+    id: UUID
+    status: job_db.JobStatus
+    kind: job_db.JobKind = "generate"
+    chunk_id: Optional[UUID] = None
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+
+def job_out(job) -> GenerationJobOut:
+    return GenerationJobOut(
+        id=job.id,
+        status=job.status,
+        kind=job.kind,
+        chunk_id=job.chunk_id,
+        error=job.error,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
     )
 
 
-@router.get("/{chunk_id}", response_model=WorkoutChunkOut)
-async def read_workout_chunk(chunk_id: UUID, current_user: User = Depends(get_current_user)) -> WorkoutChunkOut:
-    """Retrieve a workout chunk by its ID."""
+def chunk_summary_data(chunk) -> dict:
+    """A WorkoutChunkSummary as a plain dict, ready for TrustedJSONResponse."""
+    return {
+        "id": chunk.id,
+        "created_at": chunk.created_at,
+        "completed_at": chunk.completed_at,
+        "model": chunk.model,
+    }
+
+
+def wants_msgpack(request: Request) -> bool:
+    return wire.accepts_msgpack(request.headers.get("accept", ""))
+
+
+def weeks_response(
+    request: Request, content: dict, status_code: int = 200, headers: Optional[dict] = None
+) -> Response:
+    """Send a chunk, or a page of them, as JSON or, when the client's Accept
+    prefers it, as MessagePack with each week in the columnar layout.
+
+    `content` holds plain dicts, with weeks as `get_workout_week_data` gives them.
+    """
+    headers = {"Vary": "Accept", **(headers or {})}
+    if not wants_msgpack(request):
+        return TrustedJSONResponse(content, status_code=status_code, headers=headers)
+
+    def columnar(chunk: dict) -> dict:
+        if "workouts" not in chunk:
+            return chunk
+        return {**chunk, "workouts": wire.week_to_columns(chunk["workouts"])}
+
+    if "items" in content:
+        content = {**content, "items": [columnar(item) for item in content["items"]]}
+    else:
+        content = columnar(content)
+    return MsgpackResponse(content, status_code=status_code, headers=headers)
+
 
-    chunk = await workout_db.get_workout_chunk(chunk_id)
+# Documents the MessagePack alternative to JSON in the OpenAPI schema
+MSGPACK_CONTENT = {"content": {wire.MSGPACK_MEDIA_TYPE: {}}}
+
+router = APIRouter(
+    prefix="/workouts", tags=["workouts"], default_response_class=TrustedJSONResponse
+)
+
+
+async def get_owned_chunk(chunk_id: UUID, current_user: CachedUser):
+    chunk = await workout_db.get_user_workout_chunk(current_user.id, chunk_id)
     if not chunk:
         raise HTTPException(status_code=404, detail="Workout chunk not found")
+    return chunk
+
+
+def encode_cursor(chunk) -> str:
+    key = f"{chunk.created_at.isoformat()}|{chunk.id}"
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    try:
+        created_at, chunk_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), UUID(chunk_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/", response_model=WorkoutChunkPage, responses={200: MSGPACK_CONTENT})
+async def list_workout_chunks(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    summary: bool = False,
+    current_user: CachedUser = Depends(get_current_user),
+) -> Response:
+    """List the caller's workout chunks, newest first.
+
+    `summary=true` leaves out the workouts, which skips loading any days
+    and sets. Send `Accept: application/msgpack` for the compact binary form.
+    """
 
-    return WorkoutChunkOut(
-        id=chunk.id,
-        user_id=chunk.user_id,
-        workouts=WorkoutWeek(**chunk.workouts),
-        created_at=chunk.created_at,
-        completed_at=chunk.completed_at,
+    before = decode_cursor(cursor) if cursor else None
+    # One extra row tells us whether there is a next page
+    chunks = await workout_db.list_workout_chunks(
+        current_user.id, limit + 1, before=before, summary=summary
     )
+    next_cursor = encode_cursor(chunks[limit - 1]) if len(chunks) > limit else None
+    chunks = chunks[:limit]
 
+    items = [chunk_summary_data(c) for c in chunks]
+    if not summary:
+        weeks = await workout_db.get_workout_week_data(chunks)
+        for item in items:
+            item["workouts"] = weeks[item["id"]]
+    return weeks_response(request, {"items": items, "next_cursor": next_cursor})
 
-@router.put("/{chunk_id}", response_model=WorkoutChunkOut)
+
+@router.post("/", response_model=GenerationJobOut, status_code=202)
+async def create_workout_chunk(from_scratch: bool = False, current_user: CachedUser = Depends(get_current_user)) -> GenerationJobOut:
+    """Queue generation of a new workout chunk for a user.
+
+    Returns immediately with a job that can be polled at `/workouts/jobs/{id}`.
+    A user only has one pending job at a time; retries get the existing one,
+    and a pending progress job answers 409.
+    """
+
+    job, created = await job_db.get_or_create_pending_job(current_user.id)
+    if created:
+        jobs.enqueue(job.id)
+    elif job.kind != "generate":
+        raise HTTPException(status_code=409, detail="Another job is already pending")
+    return job_out(job)
+
+
+def sse_event(event: str, data: str) -> str:
+    """Format a single Server-Sent Event."""
+    return f"event: {event}\ndata: {data}\n\n"
+
+
+async def stream_week_events(user: CachedUser):
+    profile = (user.id, user.version)
+    prompt = week_prompt(user.info, profile)
+    models = routed_models("first_week", prompt)
+    loop = asyncio.get_running_loop()
+    try:
+        for i, model in enumerate(models):
+            parser = WorkoutStreamParser()
+            stream = generate_raw_week_stream(user=user.info, profile=profile, model=model)
+            deadline = loop.time() + model_timeout(model)
+            try:
+                while True:
+                    # Only the first day has a deadline; once days are going
+                    # out the model is left to finish the week
+                    next_text = stream.__anext__()
+                    if not parser.days:
+                        next_text = asyncio.wait_for(next_text, timeout=deadline - loop.time())
+                    try:
+                        text = await next_text
+                    except StopAsyncIteration:
+                        break
+                    for day in parser.feed(text):
+                        yield sse_event("day", day.model_dump_json())
+                for day in parser.close():
+                    yield sse_event("day", day.model_dump_json())
+                record_parse(parser.result())
+                if parser.days:
+                    break
+                record_fallback("first_week", model, "parse")
+                error = ValueError("No workouts could be parsed from the model response")
+            except Exception as e:
+                # Days already sent can't be taken back
+                if parser.days:
+                    raise
+                timed_out = isinstance(e, asyncio.TimeoutError)
+                record_fallback("first_week", model, "timeout" if timed_out else "error")
+                error = TimeoutError(f"{model} sent no day within {model_timeout(model)}s") if timed_out else e
+            finally:
+                await stream.aclose()
+            if i == len(models) - 1:
+                raise error
+            print(f"{model} failed to stream a week ({error}), retrying on {models[i + 1]}")
+        record_served("first_week", model)
+        chunk = await workout_db.create_workout_chunk(
+            user.id, WorkoutWeek(content=parser.days), model=model
+        )
+    except Exception as e:
+        yield sse_event("error", json.dumps({"detail": str(e)}))
+        return
+
+    yield sse_event("done", json.dumps({"chunk_id": str(chunk.id)}))
+
+
+@router.post("/stream")
+async def stream_workout_chunk(current_user: CachedUser = Depends(get_current_user)) -> StreamingResponse:
+    """Generate a new workout chunk, streaming each day as it is parsed.
+
+    Emits a `day` event per `WorkoutDay`, then a `done` event carrying the
+    id of the persisted chunk (or an `error` event). A day whose header the
+    model repeats is sent again with all of its sets, replacing the earlier
+    event. A model that fails, or sends no day within
+    `settings.MODEL_TIMEOUT_SECONDS`, is retried on the other one.
+    """
+
+    return StreamingResponse(
+        stream_week_events(current_user),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/jobs/{job_id}", response_model=GenerationJobOut)
+async def read_generation_job(job_id: UUID, current_user: CachedUser = Depends(get_current_user)) -> GenerationJobOut:
+    """Report the status of a generation job."""
+
+    job = await job_db.get_job(job_id)
+    if not job or job.user_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Generation job not found")
+
+    return job_out(job)
+
+
+@router.get("/{chunk_id}", response_model=WorkoutChunkOut, responses={200: MSGPACK_CONTENT})
+async def read_workout_chunk(
+    chunk_id: UUID, request: Request, current_user: CachedUser = Depends(get_current_user)
+) -> Response:
+    """Retrieve a workout chunk by its ID.
+
+    Sends an ETag; a matching `If-None-Match` gets a 304 without the body
+    being loaded. Send `Accept: application/msgpack` for the compact binary
+    form.
+    """
+
+    chunk = await get_owned_chunk(chunk_id, current_user)
+    tag = etag(chunk.id, chunk.version, "msgpack" if wants_msgpack(request) else "")
+    if cached := not_modified(request, tag):
+        return cached
+    weeks = await workout_db.get_workout_week_data([chunk])
+
+    return weeks_response(
+        request, {**chunk_summary_data(chunk), "workouts": weeks[chunk.id]}, headers={"ETag": tag}
+    )
+
+
+@router.put("/{chunk_id}", response_model=WorkoutChunkOut, responses={200: MSGPACK_CONTENT})
 async def update_workout_chunk(
-    chunk_id: UUID, payload: WorkoutChunkUpdate, current_user: User = Depends(get_current_user)
-) -> WorkoutChunkOut:
-    """Update the workouts for an existing chunk."""
+    chunk_id: UUID,
+    payload: WorkoutChunkUpdate,
+    request: Request,
+    current_user: CachedUser = Depends(get_current_user),
+) -> Response:
+    """Update the workouts for an existing chunk.
 
-    chunk = await workout_db.update_workout_chunk(chunk_id, payload.workouts)
+    With `If-Match`, fails with 412 if the chunk changed since that ETag.
+    """
+
+    await get_owned_chunk(chunk_id, current_user)
+    try:
+        chunk = await workout_db.update_workout_chunk(
+            chunk_id, payload.workouts, expected_version=if_match_version(request, chunk_id)
+        )
+    except VersionMismatch:
+        raise precondition_failed()
     if not chunk:
         raise HTTPException(status_code=404, detail="Workout chunk not found")
 
-    return WorkoutChunkOut(
-        id=chunk.id,
-        user_id=chunk.user_id,
-        workouts=payload.workouts,
-        created_at=chunk.created_at,
-        completed_at=chunk.completed_at,
+    tag = etag(chunk.id, chunk.version, "msgpack" if wants_msgpack(request) else "")
+    return weeks_response(
+        request,
+        {**chunk_summary_data(chunk), "workouts": payload.workouts.model_dump()},
+        headers={"ETag": tag},
+    )
+
+
+
+@router.post(
+    "/{chunk_id}/progress", response_model=WorkoutChunkOut, status_code=201,
+    responses={201: MSGPACK_CONTENT, 202: {"model": GenerationJobOut}},
+)
+async def progress_workout_chunk(
+    chunk_id: UUID,
+    request: Request,
+    week_goal: ProgressType = "Increase",
+    engine: ProgressEngine = settings.PROGRESSION_ENGINE,
+    feedback: Optional[UserFeedback] = None,
+    current_user: CachedUser = Depends(get_current_user),
+) -> Response:
+    """Create the next week's chunk by progressing an existing one.
+
+    `engine=rules` answers in milliseconds with the new chunk (201) without
+    calling the model; the engine is returned in the `X-Progression-Engine`
+    header. `engine=llm` is queued like generation and answers 202 with a
+    job to poll at `/workouts/jobs/{id}`; it falls back to the rules on
+    timeout, and the new chunk's `model` is null when it did. Retries get
+    the pending job, while another pending job answers 409.
+    """
+
+    chunk = await get_owned_chunk(chunk_id, current_user)
+    feedback = feedback or UserFeedback(interest_reports={})
+
+    if engine == "llm":
+        job, created = await job_db.get_or_create_pending_job(
+            current_user.id,
+            "progress",
+            {"chunk_id": str(chunk.id), "week_goal": week_goal, "feedback": feedback.model_dump(mode="json")},
+        )
+        if created:
+            jobs.enqueue(job.id)
+        elif job.kind != "progress" or job.params["chunk_id"] != str(chunk.id):
+            raise HTTPException(status_code=409, detail="Another job is already pending")
+        return json_response(job_out(job), status_code=202)
+
+    week, used, model = await progress_week_or_fallback(
+        current_user.info,
+        await workout_db.get_workout_week(chunk),
+        feedback,
+        week_goal,
+        engine=engine,
+        profile=(current_user.id, current_user.version),
+    )
+    new_chunk = await workout_db.create_workout_chunk(current_user.id, week, model=model)
+
+    return weeks_response(
+        request,
+        {**chunk_summary_data(new_chunk), "workouts": week.model_dump()},
+        status_code=201,
+        headers={"X-Progression-Engine": used},
     )
 
+
+@router.patch("/{chunk_id}/days/{day}/sets/{index}", response_model=WorkDone)
+async def patch_workout_set(
+    chunk_id: UUID,
+    day: WeekDay,
+    index: int,
+    payload: WorkoutSetPatch,
+    request: Request,
+    current_user: CachedUser = Depends(get_current_user),
+) -> Response:
+    """Update individual fields of one set, e.g. `{"done": true}`.
+
+    Honors `If-Match` like PUT; the chunk's new ETag is returned.
+    """
+
+    await get_owned_chunk(chunk_id, current_user)
+    try:
+        work = await workout_db.update_workout_set(
+            chunk_id, day, index, payload.model_dump(exclude_unset=True),
+            expected_version=if_match_version(request, chunk_id),
+        )
+    except VersionMismatch:
+        raise precondition_failed()
+    if not work:
+        raise HTTPException(status_code=404, detail="Set not found")
+    version = await workout_db.get_chunk_version(chunk_id)
+    return json_response(work, headers={"ETag": etag(chunk_id, version)})
+
+
+@router.patch("/{chunk_id}/sets", response_model=List[WorkDone])
+async def patch_workout_sets(
+    chunk_id: UUID,
+    payload: List[WorkoutSetBatchPatch],
+    request: Request,
+    current_user: CachedUser = Depends(get_current_user),
+) -> Response:
+    """Apply several set patches at once. Either all of them apply or none do.
+
+    Honors `If-Match` like PUT; the chunk's new ETag is returned.
+    """
+
+    await get_owned_chunk(chunk_id, current_user)
+    # Only the first write checks the version; the rest follow it in the
+    # same transaction
+    expected_version = if_match_version(request, chunk_id)
+    updated = []
+    try:
+        async with in_transaction():
+            for patch in payload:
+                work = await workout_db.update_workout_set(
+                    chunk_id, patch.day, patch.index,
+                    patch.model_dump(exclude_unset=True, exclude={"day", "index"}),
+                    expected_version=expected_version,
+                )
+                if not work:
+                    raise HTTPException(
+                        status_code=404, detail=f"Set {patch.index} on {patch.day} not found"
+                    )
+                updated.append(work)
+                expected_version = None
+    except VersionMismatch:
+        raise precondition_failed()
+    version = await workout_db.get_chunk_version(chunk_id)
+    return json_response(updated, List[WorkDone], headers={"ETag": etag(chunk_id, version)})
@@ -85,6 +85,31 @@ This user is {self.age} years old and has a {activity_semantic(self.activity_lev
 """
         return rep
     
+# How each muscle reads in feedback lines ("Decrease bicep workload"), in
+# the order UserFeedback reports them
+MUSCLE_NAMES = {
+    "biceps": "bicep",
+    "triceps": "tricep",
+    "forearms": "forearm",
+    "hands": "hand",
+    "rear_deltoids": "rear deltoid",
+    "middle_deltoids": "middle deltoid",
+    "front_deltoids": "front deltoid",
+    "upper_chest": "upper chest",
+    "chest": "chest",
+    "traps": "trap",
+    "upper_back": "upper back",
+    "lats": "lat",
+    "abs": "ab",
+    "obliques": "oblique",
+    "lower_back": "lower back",
+    "glutes": "glute",
+    "hamstrings": "hamstring",
+    "quads": "quad",
+    "calves": "calf",
+}
+FEEDBACK_ACTIONS = {"Too much": "Decrease", "Not enough": "Increase"}
+
 class UserFeedback(BaseModel):
     biceps: MuscleReportOption = "Just right"
     triceps: MuscleReportOption = "Just right"
@@ -109,85 +134,12 @@ class UserFeedback(BaseModel):
     interest_reports: dict[str, List[InterestReportOption]]
 
     def semantic(self) -> str:
-        
         mr = ""
-        if self.biceps == "Too much":
-            mr += "Decrease bicep workload\n"
-        if self.biceps == "Not enough":
-            mr += "Increase bicep workload\n"
-        if self.triceps == "Too much":
-            mr += "Decrease tricep workload\n"
-        if self.triceps == "Not enough":
-            mr += "Increase tricep workload\n"
-        if self.forearms == "Too much":
-            mr += "Decrease forearm workload\n"
-        if self.forearms == "Not enough":
-            mr += "Increase forearm workload\n"
-        if self.hands == "Too much":
-            mr += "Decrease hand workload\n"
-        if self.hands == "Not enough":
-            mr += "Increase hand workload\n"
-        if self.rear_deltoids == "Too much":
-            mr += "Decrease rear deltoid workload\n"
-        if self.rear_deltoids == "Not enough":
-            mr += "Increase rear deltoid workload\n"
-        if self.middle_deltoids == "Too much":
-            mr += "Decrease middle deltoid workload\n"
-        if self.middle_deltoids == "Not enough":
-            mr += "Increase middle deltoid workload\n"
-        if self.front_deltoids == "Too much":
-            mr += "Decrease front deltoid workload\n"
-        if self.front_deltoids == "Not enough":
-            mr += "Increase front deltoid workload\n"
-        if self.upper_chest == "Too much":
-            mr += "Decrease upper chest workload\n"
-        if self.upper_chest == "Not enough":
-            mr += "Increase upper chest workload\n"
-        if self.chest == "Too much":
-            mr += "Decrease chest workload\n"
-        if self.chest == "Not enough":
-            mr += "Increase chest workload\n"
-        if self.traps == "Too much":
-            mr += "Decrease trap workload\n"
-        if self.traps == "Not enough":
-            mr += "Increase trap workload\n"
-        if self.upper_back == "Too much":
-            mr += "Decrease upper back workload\n"
-        if self.upper_back == "Not enough":
-            mr += "Increase upper back workload\n"
-        if self.lats == "Too much":
-            mr += "Decrease lat workload\n"
-        if self.lats == "Not enough":
-            mr += "Increase lat workload\n"
-        if self.abs == "Too much":
-            mr += "Decrease ab workload\n"
-        if self.abs == "Not enough":
-            mr += "Increase ab workload\n"
-        if self.obliques == "Too much":
-            mr += "Decrease oblique workload\n"
-        if self.obliques == "Not enough":
-            mr += "Increase oblique workload\n"
-        if self.lower_back == "Too much":
-            mr += "Decrease lower back workload\n"
-        if self.lower_back == "Not enough":
-            mr += "Increase lower back workload\n"
-        if self.glutes == "Too much":
-            mr += "Decrease glute workload\n"
-        if self.glutes == "Not enough":
-            mr += "Increase glute workload\n"
-        if self.hamstrings == "Too much":
-            mr += "Decrease hamstring workload\n"
-        if self.hamstrings == "Not enough":
-            mr += "Increase hamstring workload\n"
-        if self.quads == "Too much":
-            mr += "Decrease quad workload\n"
-        if self.quads == "Not enough":
-            mr += "Increase quad workload\n"
-        if self.calves == "Too much":
-            mr += "Decrease calf workload\n"
-        if self.calves == "Not enough":
-            mr += "Increase calf workload\n"
-        
+        for muscle, name in MUSCLE_NAMES.items():
+            action = FEEDBACK_ACTIONS.get(getattr(self, muscle))
+            if action:
+                mr += f"{action} {name} workload\n"
+
         interests_semantic = ""
         for interest, reports in self.interest_reports.items():
             formatted_reports = ", ".join(reports)
@@ -0,0 +1,148 @@
+"""Compact MessagePack encoding of workout weeks.
+
+As JSON, every set repeats all of its keys and its exercise and unit
+strings. The binary form stores each day as columns, one list per WorkDone
+field, and puts every distinct exercise, unit and perceived exertion string
+once in a `strings` table that the columns index into (-1 for a missing
+perceived exertion):
+
+    {"strings": ["Squat", "reps", "lbs", ...],
+     "content": [{"day": "Monday", "date": None,
+                  "exercise": [0, 0, ...], "amount": [5.0, 5.0, ...],
+                  "amount_unit": [1, 1, ...], ..., "done": [False, ...]}]}
+
+Everything else in a response (ids, timestamps) is sent as it is in JSON,
+with UUIDs and datetimes as strings.
+"""
+import datetime as dt
+from typing import Any, Dict
+from uuid import UUID
+
+import msgpack
+
+from app.workout import WorkDone
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+MSGPACK_MEDIA_TYPES = {MSGPACK_MEDIA_TYPE, "application/x-msgpack", "application/vnd.msgpack"}
+
+SET_FIELDS = list(WorkDone.model_fields)
+STRING_FIELDS = {"exercise", "amount_unit", "intensity_unit", "perceived_exertion"}
+
+
+def week_to_columns(week: dict) -> dict:
+    """A dumped WorkoutWeek (`{"content": [day, ...]}`) in the columnar layout."""
+    codes: Dict[str, int] = {}
+
+    def intern(value) -> int:
+        if value is None:
+            return -1
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+        return code
+
+    days = []
+    for day in week["content"]:
+        sets = day["workout"]
+        columns = {"day": day["day"], "date": day.get("date")}
+        for field in SET_FIELDS:
+            if field in STRING_FIELDS:
+                columns[field] = [intern(work.get(field)) for work in sets]
+            else:
+                columns[field] = [work.get(field) for work in sets]
+        days.append(columns)
+    return {"strings": list(codes), "content": days}
+
+
+def columns_to_week(data: dict) -> dict:
+    """The inverse of `week_to_columns`."""
+    strings = data["strings"]
+    days = []
+    for columns in data["content"]:
+        values = [
+            [strings[code] if code >= 0 else None for code in columns[field]]
+            if field in STRING_FIELDS else columns[field]
+            for field in SET_FIELDS
+        ]
+        days.append({
+            "day": columns["day"],
+            "date": columns["date"],
+            "workout": [dict(zip(SET_FIELDS, row)) for row in zip(*values)],
+        })
+    return {"content": days}
+
+
+def _default(value: Any) -> Any:
+    # Same strings as the JSON responses, with "Z" for UTC
+    if isinstance(value, dt.datetime) and value.utcoffset() == dt.timedelta(0):
+        return value.replace(tzinfo=None).isoformat() + "Z"
+    if isinstance(value, (dt.date, dt.datetime)):
+        return value.isoformat()
+    if isinstance(value, UUID):
+        return str(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def pack(content: Any) -> bytes:
+    return msgpack.packb(content, default=_default)
+
+
+def unpack(data: bytes) -> Any:
+    return msgpack.unpackb(data)
+
+
+def accepts_msgpack(accept: str) -> bool:
+    """Whether an Accept header prefers MessagePack over JSON.
+
+    JSON wins ties, so clients that don't ask for MessagePack never get it.
+    """
+    quality = {}
+    for item in accept.split(","):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        quality[media_type.lower()] = max(q, quality.get(media_type.lower(), 0.0))
+
+    msgpack_q = max((quality.get(t, 0.0) for t in MSGPACK_MEDIA_TYPES), default=0.0)
+    json_q = max(quality.get(t, 0.0) for t in ("application/json", "application/*", "*/*"))
+    return msgpack_q > 0 and msgpack_q > json_q
+
+
+if __name__ == "__main__":
+    import gzip
+    import json
+    import time
+
+    import orjson
+
+    from app.workout import WorkoutWeek
+
+    def timed(fn, repeat=2000) -> float:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            fn()
+        return (time.perf_counter() - start) / repeat * 1e6
+
+    print(f"{'':<12}{'bytes':>8}{'gzip':>8}{'encode us':>11}{'decode us':>11}")
+    for path in ("week_1.json", "week_2.json"):
+        with open(path, "r") as f:
+            week = WorkoutWeek(content=json.load(f)).model_dump(mode="json")
+
+        as_json = orjson.dumps(week)
+        as_msgpack = pack(week)
+        as_columns = pack(week_to_columns(week))
+        assert columns_to_week(unpack(as_columns)) == week
+
+        print(path)
+        for name, body, encode, decode in (
+            ("json", as_json, lambda: orjson.dumps(week), lambda: orjson.loads(as_json)),
+            ("msgpack", as_msgpack, lambda: pack(week), lambda: unpack(as_msgpack)),
+            ("columnar", as_columns, lambda: pack(week_to_columns(week)), lambda: columns_to_week(unpack(as_columns))),
+        ):
+            print(f"  {name:<10}{len(body):>8}{len(gzip.compress(body)):>8}{timed(encode):>11.1f}{timed(decode):>11.1f}")
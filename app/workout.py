@@ -1,9 +1,14 @@
 from pydantic import BaseModel
-import pandas as pd
-from typing import Literal, Optional, List
+import numpy as np
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Literal, Optional, List, get_args
 import datetime as dt
 
+if TYPE_CHECKING:
+    import pandas as pd
+
 WeekDay = Literal["Sunday","Monday","Tuesday","Wednesday","Thursday","Friday","Saturday"]
+WEEK_DAYS: List[str] = list(get_args(WeekDay))
 
 class WorkDone(BaseModel):
     exercise: str 
@@ -16,8 +21,10 @@ class WorkDone(BaseModel):
     perceived_exertion: Optional[str] = None 
     done: Optional[bool] = False
 
-def workout_as_dataframe(workdone_list: List[WorkDone]) -> pd.DataFrame:
+def workout_as_dataframe(workdone_list: List[WorkDone]) -> "pd.DataFrame":
     """Convert a list of WorkDone objects to a pandas DataFrame."""
+    import pandas as pd  # analytics only; kept out of the prompt/web path
+
     if not workdone_list:
         return pd.DataFrame()  # Return an empty DataFrame if the list is empty
 
@@ -32,19 +39,141 @@ def workout_as_dataframe(workdone_list: List[WorkDone]) -> pd.DataFrame:
     return df
 
 
+# The fields a prompt shows for each set
+TABLE_COLUMNS = ["exercise", "amount", "actual_amount", "amount_unit", "intensity", "actual_intensity", "intensity_unit"]
+
+
+# One line per exercise, sets in order. Both prompts that show a week explain it
+# with COMPACT_NOTATION, and `app.ai.tools.parse_compact_week` reads it back.
+COMPACT_NOTATION = """# Workouts are listed one exercise per line as `Exercise: set, set, ...`, in order.
+# A set is `amount[/actual] unit [@ intensity[/actual] unit]`: an actual amount is left out when it matched the plan, an actual intensity when none was recorded, and the @ part when there is no intensity
+# `3 × set` is three identical sets in a row, `5 × (A: set; B: set)` is that sequence done five times in a row"""
+
+
+# Both spellings of "no unit": the model writes "", stored weeks often "None"
+NO_UNIT = ("", "None")
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _with_actual(planned: float, actual: float, default: float) -> str:
+    return _number(planned) if actual == default else f"{_number(planned)}/{_number(actual)}"
+
+
+def set_spec(work: WorkDone) -> str:
+    """One set in the compact notation, e.g. `10 reps @ 40 lbs` or `8/6 reps @ 40 lbs`."""
+    # Actual amounts are usually logged as planned, actual intensities usually not at all
+    spec = f"{_with_actual(work.amount, work.actual_amount, work.amount)} {work.amount_unit}"
+    if work.intensity or work.actual_intensity or work.intensity_unit not in NO_UNIT:
+        spec += f" @ {_with_actual(work.intensity, work.actual_intensity, 0.0)} {work.intensity_unit}"
+    return spec.rstrip()
+
+
+def _repeats(keys: List[tuple], max_block: int) -> List[tuple]:
+    """Split `keys` into (repetitions, start, length) blocks, greedily taking
+    whichever repeated block at each position covers the most sets."""
+    blocks = []
+    i = 0
+    while i < len(keys):
+        run = 1
+        while i + run < len(keys) and keys[i + run] == keys[i]:
+            run += 1
+        best = (run, i, 1)
+        for length in range(2, min(max_block, (len(keys) - i) // 2) + 1):
+            if keys[i + length] != keys[i]:
+                continue  # can't repeat right away
+            block = keys[i:i + length]
+            if block.count(block[0]) == length:
+                continue  # a run of identical sets, already counted
+            reps = 1
+            while keys[i + reps * length:i + (reps + 1) * length] == block:
+                reps += 1
+            if reps > 1 and reps * length > best[0] * best[2]:
+                best = (reps, i, length)
+        blocks.append(best)
+        i += best[0] * best[2]
+    return blocks
+
+
+def _exercise_lines(sets: List[WorkDone], blocks: List[tuple]) -> List[str]:
+    lines: List[tuple] = []
+    for reps, start, _ in blocks:
+        work = sets[start]
+        spec = set_spec(work) if reps == 1 else f"{reps} × {set_spec(work)}"
+        if lines and lines[-1][0] == work.exercise:
+            lines[-1][1].append(spec)
+        else:
+            lines.append((work.exercise, [spec]))
+    return [f"{exercise}: {', '.join(specs)}" for exercise, specs in lines]
+
+
+def compact_sets(workdone_list: List[WorkDone]) -> str:
+    """Render the TABLE_COLUMNS of sets in the COMPACT_NOTATION."""
+    keys = [tuple(getattr(work, name) for name in TABLE_COLUMNS) for work in workdone_list]
+    # "; " separates exercises inside a repeated block, so such names can't be in one
+    max_block = 1 if any("; " in work.exercise for work in workdone_list) else len(keys) // 2
+
+    lines: List[str] = []
+    singles: List[tuple] = []
+    for reps, start, length in _repeats(keys, max_block):
+        if length == 1:
+            singles.append((reps, start, length))
+            continue
+        lines.extend(_exercise_lines(workdone_list, singles))
+        singles = []
+        block = workdone_list[start:start + length]
+        inner = _exercise_lines(block, _repeats(keys[start:start + length], 1))
+        lines.append(f"{reps} × ({'; '.join(inner)})")
+    lines.extend(_exercise_lines(workdone_list, singles))
+    return "\n".join(lines)
+
+
+def _span(values: List[float]) -> str:
+    low, high = min(values), max(values)
+    return _number(low) if low == high else f"{_number(low)}-{_number(high)}"
+
+
+def summary_sets(workdone_list: List[WorkDone]) -> str:
+    """Sets and planned ranges per exercise, e.g. `Goblet Squat: 5 sets, 10-15 reps @ 30-40 lbs`.
+
+    Lossy; for fitting a long week into a prompt budget.
+    """
+    groups: Dict[tuple, List[WorkDone]] = {}
+    for work in workdone_list:
+        groups.setdefault((work.exercise, work.amount_unit, work.intensity_unit), []).append(work)
+
+    lines = []
+    for (exercise, amount_unit, intensity_unit), sets in groups.items():
+        line = f"{exercise}: {len(sets)} set{'s' if len(sets) > 1 else ''}, {_span([w.amount for w in sets])} {amount_unit}"
+        intensities = [w.intensity for w in sets]
+        if any(intensities) or intensity_unit not in NO_UNIT:
+            line += f" @ {_span(intensities)} {intensity_unit}"
+        lines.append(line.rstrip())
+    return "\n".join(lines)
+
+
 class WorkoutDay(BaseModel):
     day: WeekDay
     date: Optional[dt.date] = None  # Optional date field
     workout: List[WorkDone]
 
     def workout_df(self):
+        """Sets as a pandas DataFrame, for analytics. Imports pandas on first use."""
         return workout_as_dataframe(self.workout)
 
     def semantic(self):
-        # Use tabulate for prettier tables if you want, or stick with pandas
-        df_str = self.workout_df().to_string(index=False)
-        rep = f"{self.day}:\n{df_str}\n"
+        rep = f"{self.day}:\n{compact_sets(self.workout)}\n"
         return rep
+
+    def summary(self):
+        return f"{self.day}:\n{summary_sets(self.workout)}\n"
+
+    def outline(self):
+        """Just the day's exercises, in order; the last resort for a prompt budget."""
+        exercises = list(dict.fromkeys(work.exercise for work in self.workout))
+        return f"{self.day}: {', '.join(exercises)}\n"
     
     @staticmethod
     def example():
@@ -68,12 +197,149 @@ Monday:
 class WorkoutWeek(BaseModel):
     content : List[WorkoutDay]
 
+    def repeated_days(self) -> List[str]:
+        """Days that appear more than once. Sets are addressed by day name,
+        so a stored week must have none."""
+        seen, repeated = set(), []
+        for workout in self.content:
+            if workout.day in seen and workout.day not in repeated:
+                repeated.append(workout.day)
+            seen.add(workout.day)
+        return repeated
+
+    def merge_repeated_days(self) -> "WorkoutWeek":
+        """The week with each repeated day's sets appended to its first occurrence."""
+        merged: Dict[str, WorkoutDay] = {}
+        for workout in self.content:
+            if workout.day in merged:
+                merged[workout.day].workout.extend(w.model_copy() for w in workout.workout)
+            else:
+                merged[workout.day] = workout.model_copy(update={"workout": list(workout.workout)})
+        return WorkoutWeek(content=list(merged.values()))
+
     def semantic(self):
+        """The week in the compact notation. `app.ai.prompts.fit_week` shortens
+        it to a prompt budget."""
         workouts = ""
         for workout in self.content:
             workouts = workouts + workout.semantic() + "\n"
         return workouts
 
+@dataclass
+class WorkoutColumns:
+    """Struct-of-arrays form of one or more WorkoutWeeks.
+
+    Every set is a row across the per-set arrays. Exercise, unit and
+    perceived exertion strings are stored once in `strings` and referenced by
+    integer code (-1 for a missing perceived exertion). `day_offsets[i]` to
+    `day_offsets[i + 1]` are the sets of day i, and `week_offsets` slices the
+    days the same way. `done=None` reads back as False.
+    """
+
+    exercise: np.ndarray
+    amount: np.ndarray
+    actual_amount: np.ndarray
+    amount_unit: np.ndarray
+    intensity: np.ndarray
+    actual_intensity: np.ndarray
+    intensity_unit: np.ndarray
+    perceived_exertion: np.ndarray
+    done: np.ndarray
+    day: np.ndarray
+    date: np.ndarray
+    day_offsets: np.ndarray
+    week_offsets: np.ndarray
+    strings: List[str]
+
+    @classmethod
+    def from_weeks(cls, weeks: List["WorkoutWeek"]) -> "WorkoutColumns":
+        codes: Dict[str, int] = {}
+
+        def intern(value: str) -> int:
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(codes)
+            return code
+
+        sets = [work for week in weeks for day in week.content for work in day.workout]
+        days = [day for week in weeks for day in week.content]
+        return cls(
+            exercise=np.array([intern(w.exercise) for w in sets], dtype=np.int32),
+            amount=np.array([w.amount for w in sets], dtype=np.float64),
+            actual_amount=np.array([w.actual_amount for w in sets], dtype=np.float64),
+            amount_unit=np.array([intern(w.amount_unit) for w in sets], dtype=np.int32),
+            intensity=np.array([w.intensity for w in sets], dtype=np.float64),
+            actual_intensity=np.array([w.actual_intensity for w in sets], dtype=np.float64),
+            intensity_unit=np.array([intern(w.intensity_unit) for w in sets], dtype=np.int32),
+            perceived_exertion=np.array(
+                [-1 if w.perceived_exertion is None else intern(w.perceived_exertion) for w in sets],
+                dtype=np.int32,
+            ),
+            done=np.array([bool(w.done) for w in sets], dtype=bool),
+            day=np.array([WEEK_DAYS.index(d.day) for d in days], dtype=np.int8),
+            date=np.array([d.date if d.date else "NaT" for d in days], dtype="datetime64[D]"),
+            day_offsets=np.cumsum([0] + [len(d.workout) for d in days], dtype=np.int64),
+            week_offsets=np.cumsum([0] + [len(w.content) for w in weeks], dtype=np.int64),
+            strings=list(codes),
+        )
+
+    @classmethod
+    def from_week(cls, week: "WorkoutWeek") -> "WorkoutColumns":
+        return cls.from_weeks([week])
+
+    def __len__(self) -> int:
+        return len(self.amount)
+
+    @property
+    def n_weeks(self) -> int:
+        return len(self.week_offsets) - 1
+
+    def day_index(self) -> np.ndarray:
+        """Index of the day each set belongs to."""
+        return np.repeat(np.arange(len(self.day)), np.diff(self.day_offsets))
+
+    def week_index(self) -> np.ndarray:
+        """Index of the week each set belongs to."""
+        day_week = np.repeat(np.arange(self.n_weeks), np.diff(self.week_offsets))
+        return day_week[self.day_index()]
+
+    def totals_by_exercise(self, values: Optional[np.ndarray] = None) -> Dict[str, float]:
+        """Sum `values` (default: planned amount) per exercise name."""
+        values = self.amount if values is None else values
+        totals = np.bincount(self.exercise, weights=values, minlength=len(self.strings))
+        return {self.strings[code]: float(totals[code]) for code in np.unique(self.exercise)}
+
+    def _work(self, i: int) -> WorkDone:
+        exertion = self.perceived_exertion[i]
+        return WorkDone(
+            exercise=self.strings[self.exercise[i]],
+            amount=float(self.amount[i]),
+            actual_amount=float(self.actual_amount[i]),
+            amount_unit=self.strings[self.amount_unit[i]],
+            intensity=float(self.intensity[i]),
+            actual_intensity=float(self.actual_intensity[i]),
+            intensity_unit=self.strings[self.intensity_unit[i]],
+            perceived_exertion=None if exertion < 0 else self.strings[exertion],
+            done=bool(self.done[i]),
+        )
+
+    def _day(self, d: int) -> WorkoutDay:
+        date = self.date[d]
+        return WorkoutDay(
+            day=WEEK_DAYS[self.day[d]],
+            date=None if np.isnat(date) else date.item(),
+            workout=[self._work(i) for i in range(self.day_offsets[d], self.day_offsets[d + 1])],
+        )
+
+    def to_week(self, w: int = 0) -> "WorkoutWeek":
+        return WorkoutWeek(content=[
+            self._day(d) for d in range(self.week_offsets[w], self.week_offsets[w + 1])
+        ])
+
+    def to_weeks(self) -> List["WorkoutWeek"]:
+        return [self.to_week(w) for w in range(self.n_weeks)]
+
+
 if __name__ == "__main__":
 
     # Updated data: include amount_unit and intensity_unit
@@ -128,3 +394,76 @@ if __name__ == "__main__":
         WorkoutDay(day="Wednesday", workout=workdone_list)
     ])
     print(wk.semantic())
+
+    # Columnar vs pydantic over a year of history
+    import json
+    import pandas
+    import time
+    import tracemalloc
+
+    with open("week_1.json", "r") as f:
+        raw_week = {"content": json.load(f)}
+
+    tracemalloc.start()
+    year = [WorkoutWeek(**raw_week) for _ in range(52)]
+    models_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    columns = WorkoutColumns.from_weeks(year)
+    columns_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert columns.to_weeks() == year
+
+    n_sets = len(columns)
+    print(f"{n_sets} sets: {models_bytes / n_sets:.0f} B/set as models, {columns_bytes / n_sets:.0f} B/set as columns")
+
+    start = time.perf_counter()
+    df = pandas.concat([workout_as_dataframe(d.workout) for w in year for d in w.content])
+    by_df = df.groupby("exercise")["amount"].sum()
+    df_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    by_columns = columns.totals_by_exercise()
+    columns_ms = (time.perf_counter() - start) * 1000
+    assert by_columns == by_df.to_dict()
+    print(f"amount per exercise: {df_ms:.2f} ms via DataFrame, {columns_ms:.2f} ms via columns")
+
+    # Compact notation against the pandas table, and reading it back
+    import subprocess
+    import sys
+
+    from app.ai.prompts import fit_week
+    from app.ai.tokens import estimate_tokens
+    from app.ai.tools import parse_compact_week
+
+    def table_row(work: WorkDone) -> list:
+        # Read back, a missing intensity unit is always ""
+        return [("" if c == "intensity_unit" and work.intensity_unit in NO_UNIT else getattr(work, c)) for c in TABLE_COLUMNS]
+
+    for path in ("week_1.json", "week_2.json"):
+        with open(path, "r") as f:
+            week = WorkoutWeek(content=json.load(f))
+        table = "".join(f"{d.day}:\n{d.workout_df().to_string(index=False)}\n\n" for d in week.content)
+        compact = week.semantic()
+        assert [[table_row(w) for w in d.workout] for d in parse_compact_week(compact)] == \
+            [[table_row(w) for w in d.workout] for d in week.content]
+        table_tokens, compact_tokens = estimate_tokens(table), estimate_tokens(compact)
+        print(
+            f"{path}: ~{table_tokens} tokens as a table, ~{compact_tokens} compact "
+            f"({1 - compact_tokens / table_tokens:.0%} fewer), "
+            f"~{estimate_tokens(fit_week(week, 400))} at a 400 token budget"
+        )
+
+    # VmRSS rather than ru_maxrss, which survives the fork/exec from this process
+    rss_snippet = (
+        "import json; {extra}from app.workout import WorkoutWeek; "
+        "WorkoutWeek(content=json.load(open('week_1.json'))).semantic(); "
+        "print([l.split()[1] for l in open('/proc/self/status') if l.startswith('VmRSS')][0])"
+    )
+    for label, extra in [("semantic", ""), ("pandas", "import pandas; ")]:
+        rss = subprocess.run(
+            [sys.executable, "-c", rss_snippet.format(extra=extra)],
+            capture_output=True, text=True,
+        ).stdout.strip()
+        print(f"process RSS after building a prompt via {label}: {int(rss) // 1024} MB")